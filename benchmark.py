@@ -0,0 +1,369 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# cython: language_level=3
+"""Benchmark the stages of the CC-CEDICT to XDXF conversion.
+
+A synthetic CC-CEDICT file of the requested size is generated (no
+network is needed), converted stage by stage, and the time, throughput
+and peak memory of every stage are printed and saved in a JSON file.
+When the JSON file already exists, it is used as the baseline instead:
+the run fails if a stage got slower than the baseline by more than the
+threshold.
+
+    # save the baseline
+    python benchmark.py -n 120000 -b baseline.json
+    # later, compare with it
+    python benchmark.py -n 120000 -b baseline.json
+
+With -k, the pinyin functions of the compiled pinyin module (see
+setup.py) are timed against those of pinyin.py instead.
+"""
+
+from io import open
+from sys import exit
+from os.path import exists,join,dirname,abspath
+from random import Random
+from time import perf_counter
+from tempfile import mkdtemp
+from shutil import rmtree
+from argparse import ArgumentParser
+from json import load,dump
+from platform import python_version
+
+import u8_to_xdxf
+import pinyin
+from u8_to_xdxf import peakrss
+from lxml import etree as ET
+
+# How often each feature appears in the entries of the synthetic file,
+# close to what is found in CC-CEDICT.
+RATES = {"measureword": 0.08,   # CL:個|个[ge4]
+         "taiwan": 0.025,       # Taiwan pr. [ge5]
+         "bracketpinyin": 0.12, # used in 個|个[ge4]
+         "abbreviation": 0.18,  # (coll.), abbr. for...
+         "see": 0.04,           # see 個|个[ge4], see also 個[ge4]
+         "variant": 0.05,       # variant of 個|个[ge4]
+         "propername": 0.08}    # Capitalized pinyin
+
+WORDS = ("to be", "to have", "person", "water", "big", "small", "mountain",
+         "river", "to eat", "to drink", "city", "county", "province",
+         "book", "car", "tree", "flower", "to see", "to go", "to come",
+         "old", "new", "good", "bad", "red", "green", "heart", "mind",
+         "language", "word", "character", "(bound form)", "surname",
+         "a kind of", "used in names", "ancient", "modern", "machine",
+         "student", "teacher", "to study", "to write", "to speak", "fish",
+         "bird", "horse", "dog", "cat", "sun", "moon", "star", "sky")
+
+MEASUREWORDS = (u"個|个[ge4]", u"本[ben3]", u"隻|只[zhi1]", u"條|条[tiao2]",
+                u"張|张[zhang1]", u"輛|辆[liang4]", u"件[jian4]",
+                u"位[wei4]", u"種|种[zhong3]", u"部[bu4]")
+
+STAGES = ("pinyin", "parse", "tree", "serialize", "write")
+
+# The functions of the pinyin module compared by benchmarkkernels.
+KERNELS = ("pinyinize", "joinsyllables", "depinyinize")
+
+def generate(filename, lines, seed=0):
+    """Write a synthetic CC-CEDICT file of "lines" entries.
+
+    The entries are made up from random characters, syllables and
+    English words, with measure words, Taiwan pronunciations, pinyin in
+    brackets, abbreviations and cross-references in about the proportions
+    given in RATES. The same seed always gives the same file.
+    """
+    random = Random(seed)
+    sounds = sorted(u8_to_xdxf.ALL_SOUNDS - set(["r"]))
+    abbreviations = u8_to_xdxf.abbrlist
+    def hanzi(length):
+        return u"".join([chr(random.randint(0x4E00, 0x9FA5))
+                         for i in range(length)])
+    def pinyin(length, propername=False):
+        syllables = [random.choice(sounds) + str(random.randint(1, 5))
+                     for i in range(length)]
+        if propername:
+            syllables[0] = syllables[0].capitalize()
+        return " ".join(syllables)
+    def reference():
+        length = random.randint(1, 3)
+        return u"%s|%s[%s]" % (hanzi(length), hanzi(length), pinyin(length))
+    cedictfile = open(filename, "w", encoding="utf8")
+    cedictfile.write(u"# CC-CEDICT\n"
+                     u"# Synthetic dictionary generated by benchmark.py\n"
+                     u"#! version=1\n"
+                     u"#! entries=%d\n"
+                     u"#! date=2024-01-01T00:00:00Z\n" % lines)
+    for i in range(lines):
+        length = random.randint(1, 4)
+        jian = hanzi(length)
+        fan = jian if random.random() < 0.7 else hanzi(length)
+        translations = [" ".join(random.sample(WORDS, random.randint(1, 4)))
+                        for j in range(random.randint(1, 5))]
+        if random.random() < RATES["abbreviation"]:
+            translations[0] = random.choice(["(%s) ", "%s "]) % (
+                              random.choice(abbreviations)) + translations[0]
+        if random.random() < RATES["bracketpinyin"]:
+            translations.append(u"used in " + reference())
+        if random.random() < RATES["see"]:
+            translations.append(random.choice([u"see ", u"see also "]) +
+                                reference())
+        if random.random() < RATES["variant"]:
+            translations.insert(0, u"variant of " + reference())
+        if random.random() < RATES["measureword"]:
+            translations.append(u"CL:" + u",".join(
+                                random.sample(MEASUREWORDS,
+                                              random.randint(1, 2))))
+        if random.random() < RATES["taiwan"]:
+            translations.append(u"Taiwan pr. [%s]" % pinyin(length))
+        cedictfile.write(u"%s %s [%s] /%s/\n" % (fan, jian, pinyin(length,
+                         random.random() < RATES["propername"]),
+                         u"/".join(translations)))
+    cedictfile.close()
+
+def runstages(cedictname, xdxfname):
+    """Convert the file once, timing every stage.
+
+    pinyin: pyjoin over every pinyin of the file, with an empty cache.
+    parse: dictconvert (the pinyin cache is warm by then, so that this
+        is mostly the parsing itself).
+    tree: createxdxf.
+    serialize: ET.tostring of the whole tree.
+    write: writing the result to a file.
+    Returns a dictionary with the seconds taken by each stage, the peak
+    memory (MB) of the process at the end of each stage and the number
+    of entries.
+    """
+    seconds = {}
+    memory = {}
+    # Not timed: get every pinyin of the file, as parseentry would.
+    cedictfile = open(cedictname, "r", encoding="utf8")
+    pinyins = u8_to_xdxf.BRACKET_RE.findall(cedictfile.read())
+    cedictfile.close()
+    u8_to_xdxf.pyjoin.cache_clear()
+    start = perf_counter()
+    for pinyin in pinyins:
+        u8_to_xdxf.pyjoin(pinyin)
+    seconds["pinyin"] = perf_counter() - start
+    memory["pinyin"] = peakrss()
+    u8_to_xdxf.cedict_dict = dict()
+    u8_to_xdxf.HEADWORDS.clear()
+    start = perf_counter()
+    cedictfile = open(cedictname, "r", encoding="utf8")
+    dictionary = u8_to_xdxf.dictconvert(cedictfile)
+    cedictfile.close()
+    seconds["parse"] = perf_counter() - start
+    memory["parse"] = peakrss()
+    entries = len(dictionary) - 1
+    start = perf_counter()
+    xdxfdic = u8_to_xdxf.createxdxf(dictionary)
+    seconds["tree"] = perf_counter() - start
+    memory["tree"] = peakrss()
+    start = perf_counter()
+    xdxf_result = ET.tostring(xdxfdic, encoding="utf-8", pretty_print=True,
+                              xml_declaration=True,
+                              doctype=u8_to_xdxf.doctypestring)
+    seconds["serialize"] = perf_counter() - start
+    memory["serialize"] = peakrss()
+    start = perf_counter()
+    open(xdxfname, "wb").write(xdxf_result)
+    seconds["write"] = perf_counter() - start
+    memory["write"] = peakrss()
+    del dictionary, xdxfdic, xdxf_result
+    u8_to_xdxf.cedict_dict = dict()
+    u8_to_xdxf.HEADWORDS.clear()
+    return {"seconds": seconds, "memory": memory, "entries": entries}
+
+def benchmark(lines, repeat=3, seed=0):
+    """Generate a synthetic file of "lines" entries and time its conversion.
+
+    The conversion is run "repeat" times and the best time of each stage
+    is kept. Returns the results, ready to be saved as JSON.
+    """
+    # No progress bars in the timings.
+    u8_to_xdxf.progress = lambda iterable: iterable
+    tempdir = mkdtemp()
+    try:
+        cedictname = join(tempdir, "cedict_ts.u8")
+        xdxfname = join(tempdir, "cedict.xdxf")
+        generate(cedictname, lines, seed)
+        runs = [runstages(cedictname, xdxfname) for i in range(repeat)]
+    finally:
+        rmtree(tempdir)
+    results = {"lines": lines, "seed": seed, "repeat": repeat,
+               "entries": runs[0]["entries"],
+               "converter_version": u8_to_xdxf.version,
+               "python_version": python_version(), "stages": {}}
+    for stage in STAGES:
+        seconds = min([run["seconds"][stage] for run in runs])
+        results["stages"][stage] = {
+            "seconds": round(seconds, 4),
+            "lines_per_second": round(lines / seconds, 1) if seconds else None,
+            # The peak memory only grows from one run to the next, only
+            # the first run tells how much each stage needs.
+            "peak_rss_mb": round(runs[0]["memory"][stage], 1)}
+    return results
+
+def loadpurepinyin():
+    """Import pinyin.py itself, even if the compiled module is there."""
+    from importlib.util import spec_from_file_location,module_from_spec
+    spec = spec_from_file_location("pinyin_py",
+                                   join(dirname(abspath(__file__)),
+                                        "pinyin.py"))
+    module = module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def benchmarkkernels(lines, repeat=3, seed=0):
+    """Time the pinyin functions, compiled and in pure Python.
+
+    Every function of KERNELS is run over the pinyin of a synthetic file
+    of "lines" entries (depinyinize over the same pinyin with tone
+    marks), with the compiled pinyin module (see setup.py) and with
+    pinyin.py, and the best of "repeat" runs is kept. Both must give the
+    same results. Returns the microseconds taken by every function with
+    either module (None for the compiled one when it is not built).
+    """
+    tempdir = mkdtemp()
+    try:
+        cedictname = join(tempdir, "cedict_ts.u8")
+        generate(cedictname, lines, seed)
+        cedictfile = open(cedictname, "r", encoding="utf8")
+        pinyins = u8_to_xdxf.BRACKET_RE.findall(cedictfile.read())
+        cedictfile.close()
+    finally:
+        rmtree(tempdir)
+    pure = loadpurepinyin()
+    marked = [pure.joinsyllables(syllables) for syllables in pinyins]
+    modules = [pure, pinyin] if pinyin.COMPILED else [pure]
+    results = {"lines": lines, "compiled": pinyin.COMPILED, "kernels": {}}
+    for kernel in KERNELS:
+        data = marked if kernel == "depinyinize" else pinyins
+        timings = []
+        outputs = []
+        for module in modules:
+            function = getattr(module, kernel)
+            best = None
+            for i in range(repeat):
+                start = perf_counter()
+                output = [function(item) for item in data]
+                seconds = perf_counter() - start
+                if best is None or seconds < best:
+                    best = seconds
+            timings.append(best / len(data) * 1e6)
+            outputs.append(output)
+        if len(outputs) == 2 and outputs[0] != outputs[1]:
+            raise AssertionError("The compiled %s gives other results." %
+                                 kernel)
+        results["kernels"][kernel] = {
+            "python_us": round(timings[0], 3),
+            "compiled_us": round(timings[1], 3) if len(timings) == 2
+                           else None}
+    return results
+
+def compare(results, baseline, threshold):
+    """Compare the results with the baseline.
+
+    Returns the list of the stages that are slower than in the baseline
+    by more than "threshold" (0.2 meaning 20%).
+    """
+    regressions = []
+    for stage in STAGES:
+        before = baseline["stages"][stage]["seconds"]
+        after = results["stages"][stage]["seconds"]
+        if after > before * (1 + threshold):
+            regressions.append(stage)
+    return regressions
+
+if __name__=='__main__':
+    argparser = ArgumentParser(description="Benchmark the stages of the "
+                                           "conversion on a synthetic "
+                                           "CC-CEDICT file.")
+    argparser.add_argument("-n", "--lines", help="Number of entries of the "
+                                                 "synthetic file (default: "
+                                                 "20000).",
+                                                 type=int, default=20000)
+    argparser.add_argument("-r", "--repeat", help="Number of runs, the best "
+                                                  "time of each stage is "
+                                                  "kept (default: 3).",
+                                                  type=int, default=3)
+    argparser.add_argument("-s", "--seed", help="Seed of the synthetic file "
+                                                "(default: 0).",
+                                                type=int, default=0)
+    argparser.add_argument("-b", "--baseline", help="JSON file with the "
+                                                    "baseline. It is written "
+                                                    "if it does not exist, "
+                                                    "else the results are "
+                                                    "compared with it.")
+    argparser.add_argument("-u", "--update", help="Overwrite the baseline "
+                                                  "with the new results.",
+                                                  action="store_true")
+    argparser.add_argument("-t", "--threshold", help="How much slower a "
+                                                     "stage can get before "
+                                                     "the benchmark fails "
+                                                     "(default: 0.2, i.e. "
+                                                     "20%%).",
+                                                     type=float, default=0.2)
+    argparser.add_argument("-k", "--kernels", help="Time the pinyin "
+                                                   "functions of the compiled "
+                                                   "pinyin module against "
+                                                   "those of pinyin.py.",
+                                                   action="store_true")
+    argparser.add_argument("-g", "--generate", help="Only write a synthetic "
+                                                    "CC-CEDICT file with this "
+                                                    "name.")
+    args = argparser.parse_args()
+
+    if args.generate:
+        generate(args.generate, args.lines, args.seed)
+        exit()
+
+    if args.kernels:
+        results = benchmarkkernels(args.lines, args.repeat, args.seed)
+        if not results["compiled"]:
+            print ("The pinyin module is not compiled (python setup.py "
+                   "build_ext --inplace), only pinyin.py is timed.")
+        print ("%-14s %12s %14s %9s" % ("function", "python (us)",
+                                         "compiled (us)", "speedup"))
+        for kernel in KERNELS:
+            result = results["kernels"][kernel]
+            if result["compiled_us"] is None:
+                print ("%-14s %12.2f %14s %9s" % (kernel,
+                       result["python_us"], "-", "-"))
+            else:
+                print ("%-14s %12.2f %14.2f %8.2fx" % (kernel,
+                       result["python_us"], result["compiled_us"],
+                       result["python_us"] / result["compiled_us"]))
+        exit()
+
+    results = benchmark(args.lines, args.repeat, args.seed)
+    baseline = None
+    if args.baseline and exists(args.baseline) and not args.update:
+        baseline = load(open(args.baseline, "r", encoding="utf8"))
+        if baseline["lines"] != args.lines:
+            print ("The baseline was made with %d lines, not %d." %
+                   (baseline["lines"], args.lines))
+            exit(2)
+    print ("%d lines, %d entries" % (results["lines"], results["entries"]))
+    print ("%-10s %10s %14s %12s %10s" % ("stage", "seconds", "lines/s",
+                                          "peak MB", "baseline"))
+    for stage in STAGES:
+        result = results["stages"][stage]
+        if baseline is not None:
+            change = "%+.0f%%" % ((result["seconds"] /
+                                   baseline["stages"][stage]["seconds"] - 1)
+                                  * 100)
+        else:
+            change = ""
+        print ("%-10s %10.3f %14.0f %12.1f %10s" % (stage, result["seconds"],
+               result["lines_per_second"], result["peak_rss_mb"], change))
+    if baseline is None:
+        if args.baseline:
+            dump(results, open(args.baseline, "w", encoding="utf8"), indent=2)
+            print ("\nBaseline saved to \"%s\"." % args.baseline)
+        exit()
+    regressions = compare(results, baseline, args.threshold)
+    if regressions:
+        print ("\nSlower than the baseline by more than %.0f%%: %s" %
+               (args.threshold * 100, ", ".join(regressions)))
+        exit(1)
+    print ("\nNo stage is slower than the baseline by more than %.0f%%." %
+           (args.threshold * 100))
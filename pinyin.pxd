@@ -0,0 +1,18 @@
+# cython: language_level=3
+# C types of the hot functions of pinyin.py. Cython reads this file when
+# it compiles pinyin.py into an extension module (see setup.py); the
+# pure Python module, used when the extension is not built, ignores it.
+
+import cython
+
+@cython.locals(syllable=object)
+cpdef marksyllable(m, bint raise_exception=*)
+
+@cython.locals(length=Py_ssize_t, i=Py_ssize_t, tone=Py_ssize_t,
+               newstr=list, lc=str, so_far=str, before_match=str,
+               after_match=str, following=str)
+cpdef str depinyinize(str src)
+
+@cython.locals(syllablelist=list, relevantsyl=list, i=Py_ssize_t,
+               finalword=str)
+cpdef str joinsyllables(str pinyinsyllables)
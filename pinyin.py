@@ -0,0 +1,358 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# https://github.com/k-sl/CedictXML
+# cython: language_level=3
+"""Pinyin conversion: numbered pinyin to tone marks and back.
+
+Only the standard library is needed, and the tables are built once, when
+the module is imported, and cannot be changed afterwards:
+
+    from pinyin import pinyinize, pyjoin, depinyinize
+    pinyinize("ni3 hao3")    # "nǐ hǎo"
+    pyjoin("Xi1 an1")        # "Xī'ān"
+    depinyinize("nǐ hǎo")    # "ni3 hao3"
+
+The module can be compiled with Cython (see setup.py and pinyin.pxd);
+the compiled module is then imported instead of this file.
+"""
+
+from functools import lru_cache
+from re import compile,I
+from types import MappingProxyType
+
+# True for the extension module built from this file by setup.py.
+COMPILED = __file__.endswith((".so", ".pyd"))
+
+PINYIN_RE = compile(r'(([bcdfghjklmnpqrstwxyz]*)(u:an|u:|u:e|[aeiou]+)([bcdfghjklmnpqrstwxyz]*)|r)([1-5])', I)
+
+TONE_MARKS = {
+    'a':u'_āáǎàa',
+    'e':u'_ēéěèe',
+    'i':u'_īíǐìi',
+    'o':u'_ōóǒòo',
+    'u':u'_ūúǔùu',
+    'u:':u'_ǖǘǚǜü'
+}
+
+# use upper() to get the upper case versions
+TONE_MARKS['A'] = TONE_MARKS['a'].upper()
+TONE_MARKS['E'] = TONE_MARKS['e'].upper()
+TONE_MARKS['I'] = TONE_MARKS['i'].upper()
+TONE_MARKS['O'] = TONE_MARKS['o'].upper()
+TONE_MARKS['U'] = TONE_MARKS['u'].upper()
+TONE_MARKS['U:'] = TONE_MARKS['u:'].upper()
+TONE_MARKS = MappingProxyType(TONE_MARKS)
+
+ALL_SOUNDS = frozenset(['a', 'ai', 'an', 'ang', 'ao', 'ba', 'bai', 'ban', 'bang',
+    'bao', 'bei', 'ben', 'beng', 'bi', 'bian', 'biao', 'bie', 'bin', 'bing',
+    'bo', 'bu', 'ca', 'cai', 'can', 'cang', 'cao', 'ce', 'cen', 'ceng', 'cha',
+    'chai', 'chan', 'chang', 'chao', 'che', 'chen', 'cheng', 'chi', 'chong',
+    'chou', 'chu', 'chuai', 'chuan', 'chuang', 'chui', 'chun', 'chuo', 'ci',
+    'cong', 'cou', 'cu', 'cuan', 'cui', 'cun', 'cuo', 'da', 'dai', 'dan',
+    'dang', 'dao', 'de', 'dei', 'den', 'deng', 'di', 'dian', 'diao', 'die',
+    'ding', 'diu', 'dong', 'dou', 'du', 'duan', 'dui', 'dun', 'duo', 'e', 'en',
+    'er', 'fa', 'fan', 'fang', 'fei', 'fen', 'feng', 'fo', 'fou', 'fu', 'ga',
+    'gai', 'gan', 'gang', 'gao', 'ge', 'gei', 'gen', 'geng', 'gong', 'gou',
+    'gu', 'gua', 'guai', 'guan', 'guang', 'gui', 'gun', 'guo', 'ha', 'hai',
+    'han', 'hang', 'hao', 'he', 'hei', 'hen', 'heng', 'hong', 'hou', 'hu',
+    'hua', 'huai', 'huan', 'huang', 'hui', 'hun', 'huo', 'ji', 'jia', 'jian',
+    'jiang', 'jiao', 'jie', 'jin', 'jing', 'jiong', 'jiu', 'ju', 'juan', 'jue',
+    'jun', 'ka', 'kai', 'kan', 'kang', 'kao', 'ke', 'ken', 'keng', 'kong',
+    'kou', 'ku', 'kua', 'kuai', 'kuan', 'kuang', 'kui', 'kun', 'kuo', 'la',
+    'lai', 'lan', 'lang', 'lao', 'le', 'lei', 'leng', 'li', 'lia', 'lian',
+    'liang', 'liao', 'lie', 'lin', 'ling', 'liu', 'long', 'lou', 'lu', 'luan',
+    'lun', 'luo', 'lu:', 'lu:an', 'lu:e', 'ma', 'mai',     'man', 'mang', 'mao',
+    'me', 'mei', 'men', 'meng', 'mi', 'mian', 'miao',     'mie', 'min', 'ming',
+    'miou', 'mo', 'mou', 'mu', 'na', 'nai', 'nan',     'nang', 'nao', 'ne', 'nei',
+    'nen', 'neng', 'ni', 'nian', 'niang', 'niao',     'nie', 'nin', 'ning', 'niu',
+    'nong', 'nou', 'nu', 'nuan', 'nuo',     'nu:', 'nu:e', 'ou', 'pa', 'pai', 'pan',
+    'pang', 'pao', 'pei', 'pen',     'peng', 'pi', 'pian', 'piao', 'pie', 'pin',
+    'ping', 'po', 'pou', 'pu', 'qi',     'qia', 'qian', 'qiang', 'qiao', 'qie',
+    'qin', 'qing', 'qiong', 'qiu', 'qu',     'quan', 'que', 'qun', 'r', 'ran',
+    'rang', 'rao', 're', 'ren', 'reng', 'ri',     'rong', 'rou', 'ru', 'ruan',
+    'rui', 'run', 'ruo', 'sa', 'sai', 'san',     'sang', 'sao', 'se', 'sen', 'seng',
+    'sha', 'shai', 'shan', 'shang', 'shao',     'she', 'shei', 'shen', 'sheng',
+    'shi', 'shou', 'shu', 'shua', 'shuai',     'shuan', 'shuang', 'shui', 'shun',
+    'shuo', 'si', 'song', 'sou', 'su',     'suan', 'sui', 'sun', 'suo', 'ta', 'tai',
+    'tan', 'tang', 'tao', 'te',     'teng', 'ti', 'tian', 'tiao', 'tie', 'ting',
+    'tong', 'tou', 'tu', 'tuan',     'tui', 'tun', 'tuo', 'wa', 'wai', 'wan',
+    'wang', 'wei', 'wen', 'weng', 'wo',     'wu', 'xi', 'xia', 'xian', 'xiang',
+    'xiao', 'xie', 'xin', 'xing', 'xiong',     'xiu', 'xu', 'xuan', 'xue', 'xun',
+    'ya', 'yan', 'yang', 'yao', 'ye', 'yi',     'yin', 'ying', 'yong', 'you', 'yu',
+    'yuan', 'yue', 'yun', 'za', 'zai',     'zan', 'zang', 'zao', 'ze', 'zen',
+    'zeng', 'zha', 'zhai', 'zhan', 'zhang',     'zhao', 'zhe', 'zhen', 'zheng',
+    'zhi', 'zhong', 'zhou', 'zhu', 'zhua',     'zhuai', 'zhuan', 'zhuang', 'zhui',
+    'zhun', 'zhuo', 'zi', 'zong', 'zou',     'zu', 'zuan', 'zui', 'zun', 'zuo'])
+
+def tonemark(m, raise_exception=False):
+    """Put the tone mark on a syllable matched by PINYIN_RE."""
+    syllable, pre, vowels, post, tone = m.groups()
+    vowels = list(vowels)
+    if ':' in vowels:
+        dot_dot_index = vowels.index(':')
+        vowels[dot_dot_index - 1] += vowels[dot_dot_index]
+        del vowels[dot_dot_index]
+
+    if syllable.lower() == 'r' and tone == '5':
+        return syllable
+
+    tone = int(tone)
+
+    v = [c.lower() for c in vowels]
+    # 3 rules
+    # 1- A and E get the tone mark if either one present (they are never both present)
+    # 2- in ou, o gets the tone mark
+    # 3- in all other cases, last vowel gets the tone
+    # see http://pinyin.info/rules/where.html
+
+    # rule 1
+    if 'a' in v:
+        tindex = v.index('a')
+    elif 'e' in v:
+        tindex = v.index('e')
+    elif 'ou' == v: # rule 2
+        tindex = 0
+    else: # rule 3
+        tindex = len(v) - 1
+
+
+    try:
+        vowels = [v for v in vowels]
+        vowels[tindex] = TONE_MARKS[vowels[tindex]][tone]
+
+        vowels = [v if ':' not in v else TONE_MARKS[v][5] for v in vowels]
+
+        vowels = u''.join(vowels)
+        return "%s%s%s" % (pre, vowels, post)
+    except:
+#        import sys
+#        import traceback
+#        typ, err, tb = sys.exc_info()
+#        traceback.print_tb(tb)
+#        print typ, err
+        if raise_exception:
+            raise
+        return m.group(0)
+
+def syllabletable():
+    """Work out the tone marks of every standard syllable in advance.
+
+    Returns a dictionary mapping every syllable of ALL_SOUNDS with every
+    tone, in lower case and capitalized (e.g. "zhong1", "Zhong1"), to
+    its form with tone marks ("zhōng", "Zhōng").
+    """
+    syllables = {}
+    for sound in ALL_SOUNDS:
+        for tone in "12345":
+            form = sound + tone
+            m = PINYIN_RE.match(form)
+            if m is None or m.group(0) != form:
+                continue
+            try:
+                syllable = tonemark(m)
+            except:
+                # Left for pinyinize to fail on, as it always did.
+                continue
+            syllables[form] = syllable
+            # Only the first letter changes case: no need to work the
+            # capitalized form out again.
+            syllables[form.capitalize()] = syllable.capitalize()
+    return syllables
+
+SYLLABLES = MappingProxyType(syllabletable())
+
+def marksyllable(m, raise_exception=False):
+    """Put the tone mark on a syllable matched by PINYIN_RE, quickly.
+
+    The standard syllables are looked up in SYLLABLES, the others are
+    worked out by tonemark.
+    """
+    syllable = SYLLABLES.get(m.group(0))
+    if syllable is None:
+        syllable = tonemark(m, raise_exception)
+    return syllable
+
+def pinyinize(src, raise_exception=False):
+    "Turns a source string like 'ni3 hao3' into a utf-8 equivalent with tone marks"
+
+    try:
+        if raise_exception:
+            return PINYIN_RE.sub(lambda m: marksyllable(m, True), src)
+        return PINYIN_RE.sub(marksyllable, src)
+    except:
+#        import sys
+#        import traceback
+#        typ, err, tb = sys.exc_info()
+#        traceback.print_tb(tb)
+#        print typ, err, 'src=', repr(src)
+        if raise_exception:
+            raise
+
+        return src
+
+def soundindex():
+    """Index the sounds of ALL_SOUNDS by vowel, for depinyinize.
+
+    Returns a dictionary mapping every vowel that can carry a tone mark
+    (in lower case) to a tuple of (sound, before, after) tuples, where
+    before and after are the parts of the sound before and after the
+    vowel. The longest sounds come first, so that they are tried first,
+    and of these the ones with the longest part before the vowel.
+    """
+    index = {}
+    for k in TONE_MARKS:
+        letter = k.lower()
+        if letter in index:
+            continue
+        candidates = []
+        for sound in ALL_SOUNDS:
+            li = sound.find(letter)
+            if li != -1:
+                candidates.append((sound, sound[:li], sound[li+len(letter):]))
+        # Between sounds of the same length, the one taking more of the
+        # letters already typed comes first ("niú", not "en" + "iú").
+        candidates.sort(key=lambda c: (-len(c[0]), -len(c[1]), c[0]))
+        index[letter] = tuple(candidates)
+    return index
+
+# Every character with a tone mark, with its vowel and tone.
+UNMARKED = MappingProxyType(dict((c, (k, i+1)) for k, v in TONE_MARKS.items()
+                                 for i, c in enumerate(v[1:5])))
+SOUND_INDEX = MappingProxyType(soundindex())
+# The vowels without tone marks.
+VOWELS = "aeiou" + TONE_MARKS['u:'][5]
+# ü and Ü without a tone mark.
+U_DIAERESIS = TONE_MARKS['u:'][5]
+CAPITAL_U_DIAERESIS = TONE_MARKS['U:'][5]
+
+def depinyinize(src):
+    "Turns a source string like 'nǐ hǎo' into 'ni3 hao3'"
+
+    newstr = []
+    lc = src.lower()
+    length = len(src)
+    i = 0
+    while i < length:
+        c = src[i]
+
+        # see if this is a character with a tone mark
+        if c in UNMARKED:
+            letter, tone = UNMARKED[c]
+
+            # every sound that includes this vowel, longest sounds first
+            possible_sounds = SOUND_INDEX[letter.lower()]
+
+            sound = None
+            # no sound is longer than 6 letters, so the last 6 pieces
+            # are all we need to look at
+            so_far = u''.join(newstr[-6:]).lower()
+            for p, before_match, after_match in possible_sounds:
+                # a consonant followed by a vowel starts the next sound
+                # ("kěnéng" is kě-néng), it can't end this one
+                following = lc[len(after_match)+i+1:len(after_match)+i+2]
+                if (after_match and after_match[-1] not in VOWELS and
+                        following and (following in VOWELS or
+                                       following in UNMARKED)):
+                    continue
+                # see if this sound's spelling matches what we have...
+                if ((len(before_match) == 0 # either there's nothing before the match
+                    or so_far[-len(before_match):] == before_match) # or the bit before the match is in our string
+                    and # ... AND
+                    # the bit after the match is 0 or matches our string
+                   (len(after_match) == 0 or lc[i+1:len(after_match)+i+1] == after_match)):
+                    sound = p
+                    break
+            if sound:
+
+                newstr.append(letter)
+                # preserve case, use chars from original string
+                newstr += list(src[i+1:len(after_match)+i+1])
+                newstr.append(u'%d' % tone)
+                i += len(after_match) + 1
+            else:
+                newstr.append(letter)
+                i += 1
+
+        else: # no tone mark, check for neutral tone ü
+            if c == CAPITAL_U_DIAERESIS:
+                newstr.append('U:')
+            elif c == U_DIAERESIS:
+                newstr.append('u:')
+            else:
+                newstr.append(c)
+            i += 1
+
+    return u''.join(newstr)
+
+@lru_cache(maxsize=65536)
+def depinyinizeword(word):
+    """depinyinize for a single word, with its results cached.
+
+    A sound never spans a blank, so words can be converted separately.
+    """
+    return depinyinize(word)
+
+# A word: anything between blanks.
+WORD_RE = compile(r"\S+")
+
+def depinyinizelines(lines):
+    """Turn lines of pinyin with tone marks into numbered pinyin.
+
+    "lines" is any iterable of lines (a list, an open file...). The
+    converted lines are yielded one by one, so that a file of any size
+    can be converted without reading it into memory, and the words are
+    converted through depinyinizeword, so that every different word is
+    only converted once.
+    """
+    for line in lines:
+        yield WORD_RE.sub(lambda m: depinyinizeword(m.group(0)), line)
+
+@lru_cache(maxsize=65536)
+def pyjoin(pinyinsyllables):
+    """Convert CEDICT-style pinyin notation to correct pinyin.
+
+    Converts the CC-CEDICT-style space-separated pinyin syllables to
+    correct pinyin with tone marks and apostrophes.
+    (Information about which syllables take a apostrophes after
+    pinyin.info.)
+
+    The results are cached, pyjoin.cache_info() gives the number of
+    hits and misses.
+    """
+    return joinsyllables(pinyinsyllables)
+
+# Letters after which an apostrophe is needed:
+APOSTROPHE_LETTERS = (u"ā", u"á", u"ǎ", u"à", u"a", u"ē", u"é", u"ě", u"è",
+                      u"e", u"ō", u"ó", u"ǒ", u"ò", u"o")
+# A capital letter in the middle of a word.
+CAPITAL_RE = compile(u".+?([A-Z]|Ā|Á|Ǎ|À|Ē|É|Ě|È|Ī|Í|Ǐ|Ì|Ō|Ó|Ǒ|Ò|Ū|Ú|Ǔ|Ù).+?")
+
+def joinsyllables(pinyinsyllables):
+    """pyjoin, without the cache."""
+    # "r5" is a mistake, 儿 when transcribed as "r" is not a syllable,
+    # it cannot have a tone.
+    pinyinsyllables = pinyinsyllables.replace("r5", "r")
+    pinyinsyllables = pinyinize(pinyinsyllables)
+    # Add apostrophe when appropriate:
+    syllablelist = pinyinsyllables.split()
+    if len(syllablelist) > 1:
+        relevantsyl = syllablelist[1:]
+        for i in range(len(relevantsyl)):
+            if relevantsyl[i].startswith(APOSTROPHE_LETTERS):
+                relevantsyl[i] = u"'" + relevantsyl[i]
+        finallist = syllablelist[:1] + relevantsyl[:]
+        finalword = "".join(finallist)
+    else:
+        finalword = "".join(syllablelist)
+    # In case the pinyin syllable belongs to a foreign name and is
+    # preceded by "·", the apostrophe is not needed (and simply wrong).
+    finalword = finalword.replace(u"·'",u"·")
+    # In case there is a capital letter in middle of a word there
+    # should be a space before it. (It's likely a several-word place
+    # name.)
+    if u"·" not in finalword:
+        needsspace = CAPITAL_RE.findall(finalword)
+        if needsspace is not []:
+            for item in needsspace:
+                finalword = finalword.replace(item, " " + item)
+    return finalword
@@ -0,0 +1,37 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Install the converter, and build the optional compiled pinyin.py.
+
+    pip install .
+    python setup.py build_ext --inplace
+
+compiles pinyin.py, with the C types declared in pinyin.pxd, into an
+extension module next to it (pinyin.cpython-*.so on Linux), which
+Python imports instead of pinyin.py. When it is not built (without
+Cython or a C compiler, the build goes on without it), pinyin.py is
+used as it is: the results are the same, only slower.
+
+xdxf_subset.dtd, used by --validate, is installed in
+share/cedictxml (see DTD_FILE in u8_to_xdxf.py).
+"""
+
+from setuptools import setup,Extension
+
+try:
+    from Cython.Build import cythonize
+except ImportError:
+    ext_modules = []
+else:
+    ext_modules = cythonize([Extension("pinyin", ["pinyin.py"])],
+                            compiler_directives={"language_level": 3})
+    # A failed build of the extension is not an error (cythonize does not
+    # keep the "optional" argument of Extension).
+    for extension in ext_modules:
+        extension.optional = True
+
+setup(name="cedictxml",
+      version="1.2",
+      py_modules=["u8_to_xdxf", "pinyin"],
+      data_files=[("share/cedictxml", ["xdxf_subset.dtd"])],
+      install_requires=["lxml", "tqdm"],
+      ext_modules=ext_modules)
@@ -0,0 +1,492 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Tests of the conversion, on synthetic CC-CEDICT files.
+
+    python -m unittest test_u8_to_xdxf
+"""
+
+from io import open
+from os import mkdir
+from os.path import join,dirname,abspath,exists
+from sys import executable
+from subprocess import run,PIPE
+from tempfile import mkdtemp
+from shutil import rmtree
+from unittest import TestCase,main
+from threading import Thread
+from zipfile import ZipFile
+from functools import partial
+from http.server import HTTPServer,SimpleHTTPRequestHandler
+from struct import unpack_from
+from gzip import decompress
+from zlib import decompressobj
+
+import u8_to_xdxf
+import pinyin
+from benchmark import generate
+
+class DepinyinizeTest(TestCase):
+    """Pinyin with tone marks back to numbered pinyin."""
+
+    def test_words(self):
+        for marked, numbered in (("nǐ hǎo", "ni3 hao3"),
+                                 ("yěniú", "ye3niu2"),
+                                 ("kěnéng", "ke3neng2"),
+                                 ("Xī'ān", "Xi1'an1"),
+                                 ("nǚ'ér", "nu:3'er2"),
+                                 ("lǜsè", "lu:4se4"),
+                                 ("Zhōngguó", "Zhong1guo2"),
+                                 ("pīnyīn", "pin1yin1")):
+            self.assertEqual(pinyin.depinyinize(marked), numbered)
+
+    def test_round_trip(self):
+        for numbered, joined in (("ye3 niu2", "ye3niu2"),
+                                 ("ke3 neng2", "ke3neng2"),
+                                 ("Xi1 an1", "Xi1'an1"),
+                                 ("dang4 an4", "dang4'an4")):
+            self.assertEqual(pinyin.depinyinize(pinyin.pyjoin(numbered)),
+                             joined)
+
+class ConversionTest(TestCase):
+    """Base class: a temporary directory, no progress bars."""
+
+    def setUp(self):
+        self.tempdir = mkdtemp()
+        self.progress = u8_to_xdxf.progress
+        u8_to_xdxf.progress = lambda iterable: iterable
+        u8_to_xdxf.HEADWORDS.clear()
+
+    def tearDown(self):
+        u8_to_xdxf.progress = self.progress
+        u8_to_xdxf.HEADWORDS.clear()
+        rmtree(self.tempdir)
+
+    def path(self, name):
+        return join(self.tempdir, name)
+
+    def read(self, name):
+        with open(self.path(name), "rb") as result:
+            return result.read()
+
+class SortedCacheTest(ConversionTest):
+    """--sort-by with -c gives the same result with a cold or warm cache."""
+
+    def convert(self, cedictname, name):
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            headwords = u8_to_xdxf.readheadwords(cedictfile)
+        writer = u8_to_xdxf.XdxfWriter(self.path(name + ".xdxf"),
+                                       self.path(name + ".xidx"))
+        writer = u8_to_xdxf.SortingWriter(writer,
+                                          u8_to_xdxf.sortkey("pinyin"))
+        cache = u8_to_xdxf.opencache(self.path("cache.db"), writer.render)
+        changes = []
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            u8_to_xdxf.streamentries(cedictfile, writer, cache=cache,
+                                     changes=changes, headwords=headwords)
+        u8_to_xdxf.closecache(cache, changes)
+        return changes
+
+    def test_warm_cache(self):
+        cedictname = self.path("cedict_ts.u8")
+        generate(cedictname, 3000)
+        self.assertTrue(self.convert(cedictname, "cold"))
+        self.assertFalse(self.convert(cedictname, "warm"))
+        self.assertEqual(self.read("cold.xdxf"), self.read("warm.xdxf"))
+        self.assertEqual(self.read("cold.xidx"), self.read("warm.xidx"))
+
+class HeadwordsTest(ConversionTest):
+    """streamxdxf resolves the same references as createxdxf."""
+
+    def test_streamxdxf(self):
+        cedictname = self.path("cedict_ts.u8")
+        generate(cedictname, 2000)
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            lines = cedictfile.read().split("\n")
+        u8_to_xdxf.cedict_dict = dict()
+        xdxfdic = u8_to_xdxf.createxdxf(u8_to_xdxf.dictconvert(lines))
+        expected = u8_to_xdxf.ET.tostring(xdxfdic).count(b"<kref>")
+        u8_to_xdxf.cedict_dict = dict()
+        self.assertTrue(expected)
+        u8_to_xdxf.streamxdxf(lines, self.path("list.xdxf"))
+        self.assertEqual(self.read("list.xdxf").count(b"<kref>"), expected)
+        u8_to_xdxf.streamxdxf(lines, self.path("jobs.xdxf"), jobs=2)
+        self.assertEqual(self.read("jobs.xdxf"), self.read("list.xdxf"))
+        # The headwords of another dictionary are not carried over.
+        u8_to_xdxf.HEADWORDS.update(["x"])
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            u8_to_xdxf.streamxdxf(cedictfile, self.path("file.xdxf"),
+                                  headwords=u8_to_xdxf.readheadwords(lines))
+        self.assertEqual(self.read("file.xdxf").count(b"<kref>"), expected)
+        u8_to_xdxf.streamxdxf(lines[:100], self.path("head.xdxf"))
+        self.assertEqual(u8_to_xdxf.HEADWORDS,
+                         u8_to_xdxf.readheadwords(lines[:100]))
+
+    def test_rejected_lines(self):
+        lines = ["# CC-CEDICT",
+                 "#! date=2020-01-01T00:00:00Z",
+                 "雙 双 [shuang1] /pair/Taiwan pr. [shuang4]/"
+                 "Taiwan pr. [shuang3]/",
+                 "單 单 not an entry",
+                 "對 对 [dui4] /see 雙|双[shuang1]/see 單|单[dan1]/",
+                 "好 好 [hao3] /good/see also 對|对[dui4]/"]
+        u8_to_xdxf.cedict_dict = dict()
+        xdxfdic = u8_to_xdxf.createxdxf(u8_to_xdxf.dictconvert(lines))
+        u8_to_xdxf.cedict_dict = dict()
+        expected = u8_to_xdxf.ET.tostring(xdxfdic, encoding="utf-8",
+                                          pretty_print=True,
+                                          xml_declaration=True,
+                                          doctype=u8_to_xdxf.doctypestring)
+        self.assertEqual(expected.count(b"<kref>"), 1)
+        u8_to_xdxf.streamxdxf(lines, self.path("cedict.xdxf"))
+        self.assertEqual(self.read("cedict.xdxf"), expected)
+
+class ValidationTest(ConversionTest):
+    """The articles are checked against xdxf_subset.dtd."""
+
+    def tearDown(self):
+        u8_to_xdxf.setvalidation(False)
+        ConversionTest.tearDown(self)
+
+    def test_validate(self):
+        ET = u8_to_xdxf.lxml()
+        u8_to_xdxf.setvalidation()
+        cedictname = self.path("cedict_ts.u8")
+        generate(cedictname, 200)
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            u8_to_xdxf.streamxdxf(cedictfile, self.path("cedict.xdxf"))
+        self.assertEqual(u8_to_xdxf.invalid_articles, 0)
+        dtd = ET.DTD(u8_to_xdxf.DTD_FILE)
+        self.assertTrue(dtd.validate(ET.parse(self.path("cedict.xdxf"))))
+        article = ET.Element("ar")
+        ET.SubElement(article, "k").text = "x"
+        u8_to_xdxf.checkarticle(article)
+        self.assertTrue(u8_to_xdxf.article_errors)
+        ET.SubElement(ET.SubElement(article, "def"), "deftext").text = "x"
+        u8_to_xdxf.checkarticle(article)
+        self.assertEqual(u8_to_xdxf.article_errors, [])
+
+class BatchTest(ConversionTest):
+    """Batches with no dictionary or with clashing output files."""
+
+    def test_empty(self):
+        self.assertEqual(u8_to_xdxf.convertfiles([], 2), [])
+
+    def test_duplicates(self):
+        tasks = [(join(name, "a.u8"), u8_to_xdxf.batchoutput(join(name,
+                  "a.u8"), self.tempdir), "xdxf") for name in ("d1", "d2")]
+        self.assertEqual(u8_to_xdxf.duplicateoutputs(tasks),
+                         [self.path("a.xdxf")])
+        with self.assertRaises(ValueError):
+            u8_to_xdxf.convertfiles(tasks, 2)
+        tasks[1] = (tasks[1][0], self.path("b.xdxf"), "xdxf")
+        self.assertEqual(u8_to_xdxf.duplicateoutputs(tasks), [])
+
+class FixtureHandler(SimpleHTTPRequestHandler):
+    """Serves the fixture directory and records the status codes."""
+
+    codes = []
+
+    def send_response(self, code, message=None):
+        self.codes.append(code)
+        SimpleHTTPRequestHandler.send_response(self, code, message)
+
+    def log_message(self, format, *args):
+        pass
+
+class DownloadTest(ConversionTest):
+    """A release is only downloaded again when it changed."""
+
+    def setUp(self):
+        ConversionTest.setUp(self)
+        mkdir(self.path("server"))
+        mkdir(self.path("downloads"))
+        generate(self.path("cedict_ts.u8"), 100)
+        with ZipFile(self.path("server/cedict.zip"), "w") as zipfile:
+            zipfile.write(self.path("cedict_ts.u8"), "cedict_ts.u8")
+        FixtureHandler.codes = []
+        self.server = HTTPServer(("127.0.0.1", 0), partial(FixtureHandler,
+                                 directory=self.path("server")))
+        Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:%d/cedict.zip" % self.server.server_port
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        ConversionTest.tearDown(self)
+
+    def test_download(self):
+        download_dir = self.path("downloads")
+        zipname, changed = u8_to_xdxf.download_cedict(download_dir, self.url)
+        self.assertEqual((zipname, changed),
+                         (join(download_dir, "cedict.zip"), True))
+        self.assertEqual(self.read("downloads/cedict.zip"),
+                         self.read("server/cedict.zip"))
+        with open(self.path("cedict_ts.u8"), "r", encoding="utf8") as cedict:
+            self.assertEqual("".join(u8_to_xdxf.readzipped(zipname)),
+                             cedict.read())
+        self.assertEqual(u8_to_xdxf.download_cedict(download_dir, self.url),
+                         (zipname, False))
+        self.assertEqual(FixtureHandler.codes, [200, 304])
+
+class CommandLineTest(ConversionTest):
+    """Base class: run u8_to_xdxf.py on a file of the temporary directory."""
+
+    def convert(self, name, *options):
+        script = join(dirname(abspath(__file__)), "u8_to_xdxf.py")
+        return run([executable, script, "-i", self.path(name), "-o",
+                    self.path("cedict.xdxf")] + list(options), stdout=PIPE,
+                   stderr=PIPE, universal_newlines=True)
+
+class InputFileTest(CommandLineTest):
+    """A missing input file is reported, a file that is not UTF-8 is not."""
+
+    def test_missing(self):
+        result = self.convert("missing.u8")
+        self.assertIn("No CC-CEDICT file was found on this location "
+                      "(\"%s\")." % self.path("missing.u8"), result.stdout)
+        self.assertNotIn("Traceback", result.stderr)
+
+    def test_undecodable(self):
+        with open(self.path("latin1.u8"), "wb") as cedictfile:
+            cedictfile.write(b"\xff\xfe not UTF-8\n")
+        result = self.convert("latin1.u8")
+        self.assertNotIn("No CC-CEDICT file", result.stdout)
+        self.assertIn("UnicodeDecodeError", result.stderr)
+
+class LookupTest(ConversionTest):
+    """Entries written with an index are found again by lookup and prefix."""
+
+    LINES = ["# CC-CEDICT",
+             "#! date=2020-01-01T00:00:00Z",
+             "北京 北京 [Bei3 jing1] /Beijing/",
+             "北 北 [bei3] /north/",
+             "背 背 [bei4] /back/",
+             "貝殼 贝壳 [bei4 ke2] /shell/",
+             "女 女 [nu:3] /woman/",
+             "綠 绿 [lu:4] /green/"]
+
+    def setUp(self):
+        ConversionTest.setUp(self)
+        u8_to_xdxf.streamxdxf(self.LINES, self.path("cedict.xdxf"),
+                              index=self.path("cedict.xidx"))
+        self.dictionary = u8_to_xdxf.XdxfDictionary(self.path("cedict.xdxf"))
+
+    def tearDown(self):
+        self.dictionary.close()
+        ConversionTest.tearDown(self)
+
+    def headwords(self, entries):
+        return [entry.split("<k>")[1].split("</k>")[0] for entry in entries]
+
+    def test_hanzi(self):
+        self.assertEqual(self.headwords(self.dictionary.lookup("北京")),
+                         ["北京"])
+        self.assertEqual(self.headwords(self.dictionary.lookup("贝壳")),
+                         ["贝壳"])
+        self.assertEqual(self.headwords(self.dictionary.lookup("貝殼")),
+                         ["贝壳"])
+        self.assertEqual(self.dictionary.lookup("南"), [])
+
+    def test_pinyin(self):
+        for word in ("Běijīng", "bei3 jing1", "beijing"):
+            self.assertEqual(self.headwords(self.dictionary.lookup(word)),
+                             ["北京"])
+        self.assertEqual(sorted(self.headwords(self.dictionary.lookup("bei"))),
+                         ["北", "背"])
+        self.assertEqual(self.headwords(self.dictionary.lookup("nǚ")), ["女"])
+        self.assertEqual(self.headwords(self.dictionary.lookup("lv")), ["绿"])
+
+    def test_prefix(self):
+        self.assertEqual(sorted(self.headwords(self.dictionary.prefix("bei"))),
+                         ["北", "北京", "背", "贝壳"])
+        self.assertEqual(len(self.dictionary.prefix("bei", 2)), 2)
+        self.assertEqual(sorted(self.headwords(self.dictionary.prefix("北"))),
+                         ["北", "北京"])
+        self.assertEqual(self.dictionary.prefix(""), [])
+
+class StardictTest(ConversionTest):
+    """The StarDict files agree with each other, the .dict.dz with .dict."""
+
+    def setUp(self):
+        ConversionTest.setUp(self)
+        generate(self.path("cedict_ts.u8"), 3000)
+        with open(self.path("cedict_ts.u8"), "r", encoding="utf8") as lines:
+            lines = lines.read().splitlines()
+        u8_to_xdxf.streamstardict(lines, self.path("plain.ifo"),
+                                  compress=False)
+        u8_to_xdxf.streamstardict(lines, self.path("cedict.ifo"))
+
+    def readidx(self, name):
+        """The (word, offset, size) records of an .idx file, in order."""
+        idx = self.read(name)
+        records = []
+        start = 0
+        while start < len(idx):
+            end = idx.index(b"\0", start)
+            offset, size = u8_to_xdxf.STARDICT_IDX.unpack_from(idx, end + 1)
+            records.append((idx[start:end], offset, size))
+            start = end + 1 + u8_to_xdxf.STARDICT_IDX.size
+        return records
+
+    def test_idx(self):
+        records = self.readidx("plain.idx")
+        words = [word for word, offset, size in records]
+        self.assertEqual(words, sorted(words, key=lambda word:
+                                       (word.lower(), word)))
+        dictionary = self.read("plain.dict")
+        end = 0
+        for word, offset, size in sorted(records, key=lambda r: r[1]):
+            self.assertEqual(offset, end)
+            end = offset + size
+            article = dictionary[offset:end].decode("utf8")
+            self.assertIn("<k>%s</k>" % word.decode("utf8"), article)
+        self.assertEqual(end, len(dictionary))
+        self.assertEqual(self.read("cedict.idx"), self.read("plain.idx"))
+
+    def test_ifo(self):
+        with open(self.path("cedict.ifo"), "r", encoding="utf8") as ifofile:
+            lines = ifofile.read().split("\n")
+        self.assertEqual(lines[0], "StarDict's dict ifo file")
+        ifo = dict(line.split("=", 1) for line in lines[1:] if line)
+        self.assertEqual(int(ifo["wordcount"]),
+                         len(self.readidx("cedict.idx")))
+        self.assertEqual(int(ifo["idxfilesize"]),
+                         len(self.read("cedict.idx")))
+        syn = self.read("cedict.syn")
+        synonyms = 0
+        start = 0
+        while start < len(syn):
+            end = syn.index(b"\0", start)
+            word, = u8_to_xdxf.STARDICT_SYN.unpack_from(syn, end + 1)
+            self.assertLess(word, int(ifo["wordcount"]))
+            synonyms += 1
+            start = end + 1 + u8_to_xdxf.STARDICT_SYN.size
+        self.assertTrue(synonyms)
+        self.assertEqual(int(ifo["synwordcount"]), synonyms)
+        self.assertEqual(ifo["sametypesequence"], "x")
+
+    def test_dictzip(self):
+        dictionary = self.read("plain.dict")
+        dictzip = self.read("cedict.dict.dz")
+        self.assertEqual(decompress(dictzip), dictionary)
+        # Header: magic, method, FEXTRA flag, ..., then the "RA" field.
+        self.assertEqual(dictzip[:4], b"\x1f\x8b\x08\x04")
+        xlen, = unpack_from("<H", dictzip, 10)
+        self.assertEqual(dictzip[12:14], b"RA")
+        length, version, chunklength, chunks = unpack_from("<HHHH", dictzip,
+                                                           14)
+        self.assertEqual((length, version), (6 + 2 * chunks, 1))
+        self.assertEqual(chunklength, u8_to_xdxf.DICTZIP_CHUNK)
+        self.assertGreater(chunks, 2)
+        sizes = unpack_from("<%dH" % chunks, dictzip, 22)
+        self.assertEqual(xlen, 4 + length)
+        # Every chunk is decompressed on its own.
+        start = 12 + xlen
+        for number, size in enumerate(sizes):
+            chunk = decompressobj(-15).decompress(dictzip[start:start + size])
+            self.assertEqual(chunk, dictionary[number * chunklength:
+                                               (number + 1) * chunklength])
+            start += size
+        self.assertEqual(len(dictzip) - start, 8)
+
+class ReverseTest(ConversionTest):
+    """The English-Chinese dictionary written by reversexdxf."""
+
+    def test_translationwords(self):
+        words = u8_to_xdxf.translationwords
+        self.assertEqual(words("to eat (of a person)"), ["eat"])
+        self.assertEqual(words("(coll.) Budd. monk in the temple"),
+                         ["monk", "temple"])
+        self.assertEqual(words("to go in and out"), ["go", "out"])
+        self.assertEqual(words("see 雙|双[shuang1]"), [])
+        self.assertEqual(words("see also 對|对[dui4]"), [])
+        self.assertEqual(words("variant of 詞|词[ci2]"), [])
+        self.assertEqual(words("abbr. for 北京[Bei3 jing1]"), [])
+        self.assertEqual(words("surname Li"), [])
+        self.assertEqual(words("see www.mdbg.net"),
+                         ["see", "www", "mdbg", "net"])
+        self.assertEqual(words("see the doctor"), ["see", "doctor"])
+
+    def test_senses(self):
+        entry = u8_to_xdxf.parseentry("吃 吃 [chi1] /to eat/to consume/eat/"
+                                      "a b/c d/e f/g h/to eat up/", 1)
+        index = u8_to_xdxf.ReverseIndex()
+        index.add(entry)
+        index.add(entry)
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.postings, 6)
+        # "eat" is in the translations 0, 2 (alone) and 7 (after the
+        # first POSTING_SENSES).
+        self.assertEqual(list(index.words["eat"]),
+                         [0 << 8 | 0b101 | u8_to_xdxf.POSTING_LATER |
+                          u8_to_xdxf.POSTING_EXACT,
+                          1 << 8 | 0b101 | u8_to_xdxf.POSTING_LATER |
+                          u8_to_xdxf.POSTING_EXACT])
+        self.assertEqual(list(index.words["consume"]),
+                         [0b10 | u8_to_xdxf.POSTING_EXACT,
+                          1 << 8 | 0b10 | u8_to_xdxf.POSTING_EXACT])
+        self.assertEqual(list(index.words["up"]),
+                         [u8_to_xdxf.POSTING_LATER,
+                          1 << 8 | u8_to_xdxf.POSTING_LATER])
+        self.assertEqual(index.entry(1), ("吃", "吃", "chī",
+                                          entry.entry_translation))
+
+    def test_article(self):
+        ET = u8_to_xdxf.lxml()
+        lines = ["# CC-CEDICT",
+                 "#! date=2020-01-01T00:00:00Z",
+                 "吃 吃 [chi1] /to eat food/to consume/",
+                 "食 食 [shi2] /eat/food/",
+                 "飯 饭 [fan4] /food/meal/",
+                 "對 对 [dui4] /see 雙|双[shuang1]/correct/"]
+        counts = {"entries": 0}
+        u8_to_xdxf.reversexdxf(lines, self.path("english.xdxf"), counts)
+        self.assertEqual(counts["entries"], 4)
+        xdxf = ET.parse(self.path("english.xdxf")).getroot()
+        self.assertEqual((xdxf.get("lang_from"), xdxf.get("lang_to")),
+                         ("ENG", "CHI"))
+        articles = dict((ar.findtext("k"), [text.text for text
+                                            in ar.iter("deftext")])
+                        for ar in xdxf.iter("ar"))
+        self.assertEqual(sorted(articles), ["consume", "correct", "eat",
+                                            "food", "meal"])
+        # The translations that are the word alone come first.
+        self.assertEqual(articles["eat"], ["食 shí: eat",
+                                           "吃 chī: to eat food"])
+        self.assertEqual(articles["food"], ["食 shí: food",
+                                            "饭 (飯) fàn: food",
+                                            "吃 chī: to eat food"])
+        self.assertEqual(articles["correct"], ["对 (對) duì: correct"])
+
+class PipelineOptionsTest(CommandLineTest):
+    """--pipeline is refused with -j or -c instead of being ignored."""
+
+    def test_refused(self):
+        generate(self.path("cedict_ts.u8"), 100)
+        for options in (("-j", "2"), ("-c", self.path("cedict.cache"))):
+            result = self.convert("cedict_ts.u8", "--pipeline", "50",
+                                  *options)
+            self.assertIn("It's not possible to use a pipeline",
+                          result.stdout)
+            self.assertFalse(exists(self.path("cedict.xdxf")))
+
+class CompressedIndexTest(ConversionTest):
+    """An index is never used with a compressed XDXF file."""
+
+    def test_compressed(self):
+        cedictname = self.path("cedict_ts.u8")
+        generate(cedictname, 200)
+        with self.assertRaises(ValueError):
+            u8_to_xdxf.XdxfWriter(self.path("cedict.xdxf.gz"),
+                                  self.path("cedict.xidx"))
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            u8_to_xdxf.streamxdxf(cedictfile, self.path("cedict.xdxf"),
+                                  index=self.path("cedict.xidx"))
+        with open(cedictname, "r", encoding="utf8") as cedictfile:
+            u8_to_xdxf.streamxdxf(cedictfile, self.path("cedict.xdxf.gz"))
+        with self.assertRaises(ValueError):
+            u8_to_xdxf.XdxfDictionary(self.path("cedict.xdxf.gz"),
+                                      self.path("cedict.xidx"))
+
+if __name__=='__main__':
+    main()
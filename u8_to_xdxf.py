@@ -3,192 +3,107 @@
 # https://github.com/k-sl/CedictXML
 # cython: language_level=3
 
-from io import open
-from re import findall,escape,compile,I
-from time import strftime,localtime
-from argparse import ArgumentParser
-from zipfile import ZipFile
-from urllib.request import urlopen
-from tempfile import TemporaryFile
-from tqdm import tqdm
-from lxml import etree as ET
-
-def pinyinize(src, raise_exception=False):
-    "Turns a source string like 'ni3 hao3' into a utf-8 equivalent with tone marks"
+from io import open,TextIOWrapper
+from re import escape,compile,I
+from sys import stdin,stdout,intern,platform,prefix
+from time import strftime,localtime,time,perf_counter,process_time
+from os import replace,remove
+from os.path import exists,join,splitext,dirname,abspath,normcase
+from mmap import mmap,ACCESS_READ
+from struct import Struct,pack
+from zlib import compressobj,crc32,DEFLATED,Z_FULL_FLUSH,Z_FINISH
+from unicodedata import normalize
+from array import array
+# lxml, tqdm, the network and the other modules only some paths need are
+# imported where they are used, so that importing this module stays quick.
 
-    try:
-        def replacer(m):
-            syllable, pre, vowels, post, tone = m.groups()
-            vowels = list(vowels)
-            if ':' in vowels:
-                dot_dot_index = vowels.index(':')
-                vowels[dot_dot_index - 1] += vowels[dot_dot_index]
-                del vowels[dot_dot_index]
-
-            if syllable.lower() == 'r' and tone == '5':
-                return syllable
-
-            tone = int(tone)
-
-            v = [c.lower() for c in vowels]
-            # 3 rules
-            # 1- A and E get the tone mark if either one present (they are never both present)
-            # 2- in ou, o gets the tone mark
-            # 3- in all other cases, last vowel gets the tone
-            # see http://pinyin.info/rules/where.html
-
-            # rule 1
-            if 'a' in v:
-                tindex = v.index('a')
-            elif 'e' in v:
-                tindex = v.index('e')
-            elif 'ou' == v: # rule 2
-                tindex = 0
-            else: # rule 3
-                tindex = len(v) - 1
+from pinyin import (PINYIN_RE,TONE_MARKS,ALL_SOUNDS,SYLLABLES,UNMARKED,
+                    SOUND_INDEX,WORD_RE,tonemark,syllabletable,pinyinize,
+                    soundindex,depinyinize,depinyinizeword,depinyinizelines,
+                    pyjoin)
+from pinyin import COMPILED as PINYIN_COMPILED
 
+version = "1.2"
+dictionaryname = "CC-CEDICT"
+currenttime = strftime("%d-%m-%Y %H:%M:%S", localtime())
+dtd_url = "https://raw.github.com/soshial/xdxf_makedict/master/format_standard/xdxf_strict.dtd"
+doctypestring = "<!DOCTYPE xdxf SYSTEM \'%s\'>" % dtd_url
+declaration = ("CedictXML: CC-CEDICT to XDXF Converter\nVersion %s\n" % version)
+src_url = "http://www.mdbg.net/chindict/chindict.php?page=cc-cedict"
+file_url = "https://www.mdbg.net/chinese/export/cedict/cedict_1_0_ts_utf-8_mdbg.zip"
+# Set from the header of the dictionary by parseheader.
+publishing_date = ""
+publishing_date_xdxf = ""
+dictionary_version = ""
+cedict_dict = dict()    # Final dictionary object
+# Simplified and traditional headwords of the dictionary, against which the
+# cross-references are checked (filled by dictconvert or readheadwords).
+HEADWORDS = set()
+unresolved_refs = 0     # Cross-references to words that are not headwords
+# Rules of the "ar" elements, set by setvalidation (see checkarticle).
+article_dtd = None
+article_errors = []     # Why the last article checked is not valid
+invalid_articles = 0    # Articles that are not valid
 
-            try:
-                vowels = [v for v in vowels]
-                vowels[tindex] = TONE_MARKS[vowels[tindex]][tone]
-
-                vowels = [v if ':' not in v else TONE_MARKS[v][5] for v in vowels]
-
-                vowels = u''.join(vowels)
-                return "%s%s%s" % (pre, vowels, post)
-            except:
-#                import sys
-#                import traceback
-#                typ, err, tb = sys.exc_info()
-#                traceback.print_tb(tb)
-#                print typ, err
-                if raise_exception:
-                    raise
-                return m.group(0)
-
-        return PINYIN_RE.sub(replacer, src)
-    except:
-#        import sys
-#        import traceback
-#        typ, err, tb = sys.exc_info()
-#        traceback.print_tb(tb)
-#        print typ, err, 'src=', repr(src)
-        if raise_exception:
-            raise
-
-        return src
-
-def depinyinize(src):
-    "Turns a source string like 'nǐ hǎo' into 'ni3 hao3'"
-
-    unmarked = {}
-    for k, v in TONE_MARKS.items():
-        for i, c in enumerate(v[1:5]):
-            unmarked[c] = (k, i+1)
-
-
-    newstr = []
-    lc = src.lower()
-    i = 0
-    while i < len(src):
-        c = src[i]
-
-        # see if this is a character with a tone mark
-        if c in unmarked:
-            letter, tone = unmarked[c]
-
-            # find every sound that includes this vowel
-            possible_sounds = [s for s in ALL_SOUNDS if letter.lower() in s]
-
-            #try and match longest sounds first
-            possible_sounds.sort(key=len)
-            possible_sounds.reverse()
-
-            sound = None
-            so_far = u''.join(newstr).lower()
-            for p in possible_sounds:
-                li = p.find(letter.lower())
-                before_match, after_match = p[:li], p[li+len(letter):]
-
-                # see if this sound's spelling matches what we have...
-                if ((len(before_match) == 0 # either there's nothing before the match
-                    or so_far[-len(before_match):] == before_match) # or the bit before the match is in our string
-                    and # ... AND
-                    # the bit after the match is 0 or matches our string
-                   (len(after_match) == 0 or lc[i+1:len(after_match)+i+1] == after_match)):
-                    sound = p
-                    break
-            if sound:
+def download_cedict(download_dir=".", url=None):
+    """Download the most recent release of CC-CEDICT, if it changed.
 
-                newstr.append(letter)
-                # preserve case, use chars from original string
-                newstr += list(src[i+1:len(after_match)+i+1])
-                newstr.append(u'%d' % tone)
-                i += len(after_match) + 1
-            else:
-                newstr.append(letter)
-                i += 1
-
-        else: # no tone mark, check for neutral tone ü
-            if c == TONE_MARKS['U:'][5]:
-                newstr.append('U:')
-            elif c == TONE_MARKS['u:'][5]:
-                newstr.append('u:')
-            else:
-                newstr.append(c)
-            i += 1
-
-    return u''.join(newstr)
-
-def download_cedict():
-    tempzip = TemporaryFile()
-    url = urlopen(file_url)
-    tempzip.write(url.read())
-    zipped_cedict = ZipFile(tempzip, 'r')
-    temptxt = TemporaryFile()
-    temptxt = zipped_cedict.open("cedict_ts.u8", "r").read()
-    zipped_cedict.close()
-    return temptxt.decode('utf8')
-
-def pyjoin(pinyinsyllables):
-    """Convert CEDICT-style pinyin notation to correct pinyin.
-
-    Converts the CC-CEDICT-style space-separated pinyin syllables to
-    correct pinyin with tone marks and apostrophes.
-    (Information about which syllables take a apostrophes after
-    pinyin.info.)
-    """
-    # Tuple of letters after which an apostrophe is needed:
-    apletters = (u"ā", u"á", u"ǎ", u"à", u"a", u"ē", u"é", u"ě", u"è", u"e",
-                 u"ō", u"ó", u"ǒ", u"ò", u"o")
-    # "r5" is a mistake, 儿 when transcribed as "r" is not a syllable,
-    # it cannot have a tone.
-    pinyinsyllables = pinyinsyllables.replace("r5", "r")
-    pinyinsyllables = pinyinize(pinyinsyllables)
-    # Add apostrophe when appropriate:
-    syllablelist = pinyinsyllables.split()
-    if len(syllablelist) > 1:
-        relevantsyl = syllablelist[1:]
-        for i in range(len(relevantsyl)):
-            if relevantsyl[i].startswith(apletters):
-                relevantsyl[i] = u"'" + relevantsyl[i]
-        finallist = syllablelist[:1] + relevantsyl[:]
-        finalword = "".join(finallist)
-    else:
-        finalword = "".join(syllablelist)
-    # In case the pinyin syllable belongs to a foreign name and is
-    # preceded by "·", the apostrophe is not needed (and simply wrong).
-    finalword = finalword.replace(u"·'",u"·")
-    # In case there is a capital letter in middle of a word there
-    # should be a space before it. (It's likely a several-word place
-    # name.)
-    if u"·" not in finalword:
-        needsspace = findall(u".+?([A-Z]|Ā|Á|Ǎ|À|Ē|É|Ě|È|Ī|Í|Ǐ|Ì|Ō|Ó|Ǒ|Ò|Ū"
-                                u"|Ú|Ǔ|Ù).+?", finalword)
-        if needsspace is not []:
-            for item in needsspace:
-                finalword = finalword.replace(item, " " + item)
-    return finalword
+    The zip file from "url" (by default file_url) is kept in
+    "download_dir", with its ETag and Last-Modified headers beside it (in
+    a ".headers" file). They are sent back with the next request, so
+    that an unchanged release is not downloaded again: the server just
+    answers "304 Not Modified" and the copy already there is used. The
+    zip file is written to disk block by block as it arrives, and never
+    held in memory as a whole.
+
+    Returns the name of the zip file and whether a new release was
+    downloaded.
+    """
+    from urllib.request import urlopen,Request
+    from urllib.error import HTTPError
+    from shutil import copyfileobj
+    from json import load,dump
+    if url is None:
+        url = file_url
+    zipname = join(download_dir, url.rsplit("/", 1)[-1])
+    headersname = zipname + ".headers"
+    request = Request(url)
+    if exists(zipname) and exists(headersname):
+        with open(headersname, "r", encoding="utf8") as headersfile:
+            headers = load(headersfile)
+        if headers.get("etag"):
+            request.add_header("If-None-Match", headers["etag"])
+        if headers.get("last_modified"):
+            request.add_header("If-Modified-Since", headers["last_modified"])
+    try:
+        response = urlopen(request)
+    except HTTPError as error:
+        if error.code == 304:
+            return zipname, False
+        raise
+    # Only replace the previous release once the new one is complete.
+    partname = zipname + ".part"
+    with open(partname, "wb") as partfile:
+        copyfileobj(response, partfile)
+    replace(partname, zipname)
+    headers = {"etag": response.headers.get("ETag"),
+               "last_modified": response.headers.get("Last-Modified")}
+    with open(headersname, "w", encoding="utf8") as headersfile:
+        dump(headers, headersfile)
+    response.close()
+    return zipname, True
+
+def readzipped(zipname):
+    """Yield the lines of the CC-CEDICT file inside the downloaded zip file.
+
+    The file is decompressed bit by bit as the lines are read, it is
+    never held in memory as a whole.
+    """
+    from zipfile import ZipFile
+    with ZipFile(zipname, "r") as zipped_cedict:
+        with zipped_cedict.open("cedict_ts.u8", "r") as cedictfile:
+            for line in TextIOWrapper(cedictfile, encoding="utf8"):
+                yield line
 
 def bracketpy(pystring):
     """Find CEDICT-style pinyin in square brackets and correct pinyin.
@@ -199,124 +114,143 @@ def bracketpy(pystring):
 
     e.g.: "拼音[pin1 yin1]" will be converted into "拼音 pīnyīn".
     """
-    if len(findall("(\[.+?\])", pystring)) >= 1:
-        cedpylist = findall("(\[.+?\])", pystring)
-        for item in cedpylist:
-            pystring = pystring.replace(item, " " + pyjoin(item[1:-1]))
-        return pystring
-    if len(findall("(\[.+?\])", pystring)) < 1:
+    if "[" not in pystring:
         return pystring
+    return BRACKET_RE.sub(lambda m: " " + pyjoin(m.group(1)), pystring)
+
+# A CC-CEDICT entry:
+# "Traditional Simplified [pin1 yin1] /translation 1/translation 2/"
+ENTRY_RE = compile(r"^(\S+) (\S+) \[([^\]]+)\] (/.+/)")
+# Measure words ("CL:個|个[ge4],本[ben3]") and Taiwan pronunciation
+# ("Taiwan pr. [ge5]") inside the translation.
+EXTRA_RE = compile(r"CL:(.+?\])(?=/)|Taiwan pr\. \[(.+?)\]")
+# CC-CEDICT-style pinyin in square brackets.
+BRACKET_RE = compile(r"\[(.+?)\]")
+
+class Entry(object):
+    """A dictionary entry, as parsed from a line of the CC-CEDICT file.
+
+    The attributes are described in dictconvert. entry_translation and
+    entry_measureword are tuples, entry_measureword and entry_taiwan are
+    None when the entry has none. There is one Entry for every line of
+    the file, so __slots__ is used to keep them small: no dictionary of
+    attributes is created for each of them.
+    """
+    __slots__ = ("entry_jian", "entry_fan", "entry_pinyin",
+                 "entry_translation", "entry_measureword", "entry_taiwan")
+
+    def __init__(self, entry_jian, entry_fan, entry_pinyin,
+                 entry_translation, entry_measureword=None,
+                 entry_taiwan=None):
+        self.entry_jian = entry_jian
+        self.entry_fan = entry_fan
+        self.entry_pinyin = entry_pinyin
+        self.entry_translation = entry_translation
+        self.entry_measureword = entry_measureword
+        self.entry_taiwan = entry_taiwan
+
+def parseentry(line, linenum):
+    """Parse a single (non-header) line of a CC-CEDICT file.
+
+    Returns an Entry with the parsed information of the entry, or None
+    if the line has to be ignored. Lines that are not understood at all
+    raise an exception.
+    """
+    # Get the four main parts of each entry.
+    parts = ENTRY_RE.match(line)
+    entry_fan, entry_jian, entry_pinyin, entry_translation = parts.groups()
+    entry_pinyin = pyjoin(entry_pinyin)
+    # Get the measure words and the Taiwan pronunciation and delete them
+    # from the translation, all in the same pass.
+    cl_list = []
+    tw_list = []
+    def extract(m):
+        if m.group(1) is not None:
+            cl_list.append(m.group(1))
+        else:
+            tw_list.append(m.group(2))
+        return ""
+    entry_translation = EXTRA_RE.sub(extract, entry_translation)
+    if len(cl_list) == 0:
+        entry_measureword = None
     else:
+        entry_measureword = " ".join(cl_list)
+        # Correct pinyin in measure words and convert into a tuple. The
+        # same measure words come back again and again, keep only one
+        # copy of each.
+        entry_measureword = bracketpy(entry_measureword)
+        entry_measureword = tuple([intern(mw) for mw
+                                   in entry_measureword.split(",")])
+    if len(tw_list) == 0:
+        entry_taiwan = None
+    elif len(tw_list) > 1:
+        # (See isentry, which rejects the same lines.)
+        print ("\nAn error occurred while parsing the Taiwan "
+              "pronunciation for line %s. This line was "
+              "ignored." % str(linenum))
+        print ("    Line", str(linenum) + ":", line)
         return None
+    else:
+        entry_taiwan = pyjoin(tw_list[0])
+    # Correct three dots to ellipsis.
+    entry_translation = entry_translation.replace(u"...", u"…")
+    # Correct the pinyin and separate the different translations
+    # into a list.
+    entry_translation = bracketpy(entry_translation)
+    entry_translation = entry_translation.split("/")
+    entry_translation = tuple(filter(None, entry_translation))
+    return Entry(entry_jian, entry_fan, entry_pinyin, entry_translation,
+                 entry_measureword, entry_taiwan)
 
-def dictconvert(dictionaryfile):
-    """Convert a CC-CEDICT file string into a python dictionary.
+def isentry(line):
+    """Whether parseentry accepts a (non-header) line of a CC-CEDICT file.
 
-    The CC-CEDICT dictionary string is converted into a python dictionary,
-    itself consisting of dictionaries. The main dictionary, cedict_dict,
-    includes a dictionary with the key "header" and the header of the
-    CC-CEDICT file as key, plus as many dictionaries as entries in the
-    CC-CEDICT dictionary with the number of the line they appear in as
-    key and dictionaries containing the parsed information for each
-    entry as follows:
+    The line has to match ENTRY_RE and give at most one Taiwan
+    pronunciation, as parseentry checks with the same patterns, without
+    parsing the whole entry.
+    """
+    parts = ENTRY_RE.match(line)
+    if parts is None:
+        return False
+    taiwan = [m for m in EXTRA_RE.finditer(parts.group(4))
+              if m.group(2) is not None]
+    return len(taiwan) < 2
 
-    Dictionary structure:
+def iterentries(lines, start=0):
+    """Parse the lines of a CC-CEDICT file one at a time.
 
-    cedict_dict (dictionaries)
-     |- header (string)
-     |- linenum (dictionaries)
-            |- entry_jian (string)
-            |- entry_fan (string)
-            |- entry_pinyin (string)
-            |- entry_translation (list of strings)
-            |- entry_measureword (list, optional)
-            |- entry_taiwan (string, optional)
-
-    header: the header of the CC-CEDICT file. (From the first line, all
-        lines starting with "#".)
-    linenum: number of the line of the entry on the CC-CEDICT file.
-    entry_jian: The Chinese word/phrase in simplified Chinese.
-    entry_taiwan: The Chinese word/phrase in traditional Chinese.
-    entry_translation: A list of strings, each being a definition of
-        the Chinese word/phrase.
-    entry_measureword: list of one or more measure words
-        (classifiers) related to the Chinese word/phrase.
+    "lines" is any iterable of lines (a list, an open file, a
+    generator...), so that the dictionary never has to be held in memory
+    as a whole. Yields a (linenum, entry) tuple for every useful line:
+    for header lines (starting with "#") entry is the header text of
+    that line, for all other lines it is the Entry returned by
+    parseentry. Lines that are not understood are reported and skipped.
+    "start" is the number of lines before the first one (when parsing
+    only a part of the file).
     """
-    linenum = int(0)
-    header = str()
-    for line in tqdm(dictionaryfile.split("\n")):
+    linenum = int(start)
+    for line in lines:
         linenum = linenum + 1
+        # Lines coming from a file still have their line break.
+        line = line.rstrip("\n")
         # So that if something goes wrong we know which line is causing the
         # problem:
         try:
             # Get the header.
             if line.startswith("#"):
-                header = header + line[2:]
-            else:
-                # Get the four main parts of each entry.
-                entry_fan = findall("^(.+?) ", line)[0]
-                entry_jian = findall("^.+? (.+?) ", line)[0]
-                entry_pinyin = pyjoin(findall(".+ \[(.+?)\] ", line)[0])
-                entry_translation = findall(".+ (\/.+\/)", line)[0]
-                # Get the measure words and delete them from the translation.
-                if len(findall("CL:(.+?])\/", entry_translation)) == 0:
-                    entry_measureword = ""
-                if len(findall("CL:(.+?])\/", entry_translation)) > 0:
-                    cl_list = entry_measureword = findall("CL:(.+?])\/",
-                                                            entry_translation)
-                    entry_measureword = cl_list[0]
-                    if len(cl_list) > 1:
-                        for cl in cl_list[1:]:
-                            entry_measureword = entry_measureword + " " + cl
-                    for cl in cl_list:
-                        entry_translation = entry_translation.replace("CL:"
-                                                                     + cl, "")
-                    # Correct pinyin in measure words and convert into list.
-                    entry_measureword = bracketpy(entry_measureword)
-                    entry_measureword = entry_measureword.split(",")
-                # Get Taiwan pronunciation and delete it from the translation.
-                if len(findall("Taiwan pr\. \[(.+?)\]",
-                      entry_translation)) == 0:
-                    entry_taiwan = ""
-                if len(findall("Taiwan pr\. \[(.+?)\]",
-                      entry_translation)) > 1:
-                    print ("\nAn error occurred while parsing the Taiwan "
-                          "pronunciation for line %s. This line was "
-                          "ignored." % str(linenum))
-                    print ("    Line", str(linenum) + ":", line)
-                if len(findall("Taiwan pr\. \[(.+?)\]",
-                      entry_translation)) == 1:
-                    entry_taiwan = (findall("Taiwan pr\. \[(.+?)\]",
-                                   entry_translation)[0])
-                    entry_translation = (entry_translation.replace
-                                        ("Taiwan pr. [" + entry_taiwan +
-                                        "]", ""))
-                    entry_taiwan = pyjoin(entry_taiwan)
-                # Correct three dots to ellipsis.
-                entry_translation = entry_translation.replace(u"...", u"…")
-                # Correct the pinyin and separate the different translations
-                # into a list.
-                entry_translation = bracketpy(entry_translation)
-                entry_translation = entry_translation.split("/")
-                entry_translation = filter(None, entry_translation)
-                # Create final dictinary object with all basic entries.
-                cedict_dict[linenum] = ({"entry_jian": entry_jian,
-                                      "entry_fan" : entry_fan,
-                                      "entry_pinyin" : entry_pinyin,
-                                      "entry_translation" :
-                                      entry_translation})
-                # Add Taiwan pronunciation and measure word when they exist.
-                if entry_taiwan != "":
-                    cedict_dict[linenum]["entry_taiwan"] = entry_taiwan
-                if entry_measureword != "":
-                    (cedict_dict[linenum]
-                    ["entry_measureword"]) = entry_measureword
+                yield linenum, line[2:]
+                continue
+            entry = parseentry(line, linenum)
         except:
             print ("Line %s was not understood and was ignored."
                   % linenum)
             print ("Line", str(linenum) + ":", line)
             continue
-    cedict_dict["header"] = header
+        if entry is not None:
+            yield linenum, entry
+
+def parseheader(header):
+    """Get the publishing date and version from the CC-CEDICT header."""
     date_pos = header.find("date=")
     global publishing_date
     publishing_date = header[date_pos+5:date_pos+15]
@@ -325,76 +259,172 @@ def dictconvert(dictionaryfile):
                            publishing_date[5:7] + "-" + publishing_date[:5])
     global dictionary_version
     dictionary_version = publishing_date.replace("-","") + "-" + version
+
+# lxml.etree, once imported by lxml.
+ET = None
+
+def lxml():
+    """Import lxml.etree the first time it is needed, and return it."""
+    global ET
+    if ET is None:
+        from lxml import etree
+        ET = etree
+    return ET
+
+def progress(iterable):
+    """Iterate with a progress bar, shown only if the output is a terminal."""
+    from tqdm import tqdm
+    return tqdm(iterable, disable=None)
+
+def dictconvert(dictionaryfile):
+    """Convert a CC-CEDICT file string into a python dictionary.
+
+    (The lines of the file, as a list, an open file or any other
+    iterable, can be given instead of the string.)
+
+    The CC-CEDICT dictionary string is converted into a python dictionary.
+    The main dictionary, cedict_dict, includes the key "header" with the
+    header of the CC-CEDICT file as value, plus as many Entry objects as
+    entries in the CC-CEDICT dictionary with the number of the line they
+    appear in as key, containing the parsed information for each entry
+    as follows:
+
+    Dictionary structure:
+
+    cedict_dict (dictionary)
+     |- header (string)
+     |- linenum (Entry)
+            |- entry_jian (string)
+            |- entry_fan (string)
+            |- entry_pinyin (string)
+            |- entry_translation (tuple of strings)
+            |- entry_measureword (tuple, or None)
+            |- entry_taiwan (string, or None)
+
+    header: the header of the CC-CEDICT file. (From the first line, all
+        lines starting with "#".)
+    linenum: number of the line of the entry on the CC-CEDICT file.
+    entry_jian: The Chinese word/phrase in simplified Chinese.
+    entry_taiwan: The Chinese word/phrase in traditional Chinese.
+    entry_translation: A tuple of strings, each being a definition of
+        the Chinese word/phrase.
+    entry_measureword: tuple of one or more measure words
+        (classifiers) related to the Chinese word/phrase.
+    """
+    if isinstance(dictionaryfile, str):
+        dictionaryfile = dictionaryfile.split("\n")
+    header = str()
+    for linenum, entry in iterentries(progress(dictionaryfile)):
+        if isinstance(entry, str):
+            header = header + entry
+        else:
+            cedict_dict[linenum] = entry
+            HEADWORDS.add(entry.entry_jian)
+            HEADWORDS.add(entry.entry_fan)
+    cedict_dict["header"] = header
+    parseheader(header)
     return cedict_dict
 
-def createxdxf(dictionary):
-    """Convert the dictionary object into a valid XDXF-format string.
+# List of abbreviations in the dictionary:
+abbreviations = [("Budd.", "Buddhism", "knl"), ("Cant.", "Cantonese",
+                "oth"), ("cf", "confer, ‘compare’", "aux"), ("Dept.",
+                "Department", ""), ("P.R.C.", "People's Republic of China",
+                ""), ("TCM", "Traditional Chinese Medicine", "knl"), ("Tw",
+                "Taiwan", ""), ("U.S.", "United States of America", ""),
+                ("Univ.", "University", ""), ("a.k.a.", "also known as",
+                "aux"), ("abbr.", "abbreviation", "aux"), ("adj.",
+                "adjective", ""), ("agr.", "agriculture", "knl"), ("arch.",
+                "archaic", "stl"), ("astron.", "astronomy", "knl"),
+                ("auto.", "automobile", ""), ("biol.", "biology", "knl"),
+                ("c.", "circa", "aux"), ("cm.", "centimetre", ""),
+                ("coll.", "colloquial", "stl"), ("derog.", "derogatory",
+                "stl"), ("dial.", "dialect", "stl"), ("e.g.",
+                "exempli gratia, ‘for example’", "aux"), ("elec.",
+                "electricity", "knl"), ("electric.", "electricity",
+                "knl"), ("esp.", "especially", "aux"), ("euph.",
+                "euphemism", "stl"), ("expr.", "expression", "aux"),
+                ("ext.", "extension", "aux"), ("fig.", "figuratively",
+                "aux"), ("geom.", "geometry", "knl"), ("gov.",
+                "government", ""), ("hist.", "history", "knl"), ("i.e.",
+                "id est, ‘that is’", "aux"), ("in.", "inches", ""),
+                ("incl.", "including", "aux"), ("interj.", "interjection",
+                "grm"), ("lab.", "laboratory", ""), ("ling.",
+                "linguistic", "knl"), ("lit.", "literally", "aux"),
+                ("math.", "mathematics", "knl"), ("med.", "medicine",
+                "knl"), ("mus. instr.", "musical instrument", ""),
+                ("myth.", "mythology", "knl"), ("onom.", "onomatopoeia",
+                "grm"), ("onomat.", "onomatopoeia", "grm"), ("orig.",
+                "originally", ""), ("pathol.", "pathology", "knl"),
+                ("pharm.", "pharmacology", "knl"), ("pr.", "pronunciation",
+                "aux"), ("psych.", "psychology", "knl"), ("punct.",
+                "punctuation", "knl"), ("stats.", "statistics", "knl"),
+                ("telecom.", "telecommunications", "knl"), ("trad.",
+                "traditional(ly)","stl"), ("translit.", "transliteration",
+                "aux"), ("usu.", "usually", "aux"), ("zool.", "zoology",
+                "knl"), ("zoolog.", "zoology", "knl"), ("sth", "something",
+                "aux"), ("sb", "somebody", "aux")]
+abbrlist = []
+for tupple in abbreviations:
+    abbrlist.append(tupple[0])
 
-    Takes a dictionary in the format provided by dictconvert and
-    returns a string with the whole dictionary content in xml format
-    following the XDXF standard as described in
-    https://github.com/soshial/xdxf_makedict/blob/master/format_standard/xdxf_description.md
+def trieregex(words):
+    """Build a regular expression pattern matching any of the given words.
+
+    The words are merged into a trie first, so that a common prefix is
+    only tested once and the cost of a match does not grow with the
+    number of words. Where a word is the prefix of another one, the
+    longer word is tried first.
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        # The empty string marks the end of a word.
+        node[""] = None
+    def pattern(node):
+        branches = [escape(char) + pattern(child)
+                    for char, child in sorted(node.items()) if char != ""]
+        if len(branches) == 0:
+            return ""
+        if len(branches) == 1 and "" not in node:
+            return branches[0]
+        if "" in node:
+            return "(?:" + "|".join(branches) + ")?"
+        return "(?:" + "|".join(branches) + ")"
+    return pattern(trie)
+
+# Any abbreviation of the list, as a whole word.
+ABBR_RE = compile(r"\b(?:" + trieregex(abbrlist) + r")(?=\W|$)")
+
+def createxdxfhead(header, lang_from="CHI", lang_to="ENG"):
+    """Create the XDXF root element with its meta information.
+
+    Takes the header of the CC-CEDICT file and returns a tuple with the
+    root "xdxf" element and its (still empty) "lexicon" element, where
+    the dictionary entries go. "lang_from" and "lang_to" are the
+    languages of the dictionary (see reversexdxf).
     """
-    # List of abbreviations in the dictionary:
-    abbreviations = [("Budd.", "Buddhism", "knl"), ("Cant.", "Cantonese",
-                    "oth"), ("cf", "confer, ‘compare’", "aux"), ("Dept.",
-                    "Department", ""), ("P.R.C.", "People's Republic of China",
-                    ""), ("TCM", "Traditional Chinese Medicine", "knl"), ("Tw",
-                    "Taiwan", ""), ("U.S.", "United States of America", ""),
-                    ("Univ.", "University", ""), ("a.k.a.", "also known as",
-                    "aux"), ("abbr.", "abbreviation", "aux"), ("adj.",
-                    "adjective", ""), ("agr.", "agriculture", "knl"), ("arch.",
-                    "archaic", "stl"), ("astron.", "astronomy", "knl"),
-                    ("auto.", "automobile", ""), ("biol.", "biology", "knl"),
-                    ("c.", "circa", "aux"), ("cm.", "centimetre", ""),
-                    ("coll.", "colloquial", "stl"), ("derog.", "derogatory",
-                    "stl"), ("dial.", "dialect", "stl"), ("e.g.",
-                    "exempli gratia, ‘for example’", "aux"), ("elec.",
-                    "electricity", "knl"), ("electric.", "electricity",
-                    "knl"), ("esp.", "especially", "aux"), ("euph.",
-                    "euphemism", "stl"), ("expr.", "expression", "aux"),
-                    ("ext.", "extension", "aux"), ("fig.", "figuratively",
-                    "aux"), ("geom.", "geometry", "knl"), ("gov.",
-                    "government", ""), ("hist.", "history", "knl"), ("i.e.",
-                    "id est, ‘that is’", "aux"), ("in.", "inches", ""),
-                    ("incl.", "including", "aux"), ("interj.", "interjection",
-                    "grm"), ("lab.", "laboratory", ""), ("ling.",
-                    "linguistic", "knl"), ("lit.", "literally", "aux"),
-                    ("math.", "mathematics", "knl"), ("med.", "medicine",
-                    "knl"), ("mus. instr.", "musical instrument", ""),
-                    ("myth.", "mythology", "knl"), ("onom.", "onomatopoeia",
-                    "grm"), ("onomat.", "onomatopoeia", "grm"), ("orig.",
-                    "originally", ""), ("pathol.", "pathology", "knl"),
-                    ("pharm.", "pharmacology", "knl"), ("pr.", "pronunciation",
-                    "aux"), ("psych.", "psychology", "knl"), ("punct.",
-                    "punctuation", "knl"), ("stats.", "statistics", "knl"),
-                    ("telecom.", "telecommunications", "knl"), ("trad.",
-                    "traditional(ly)","stl"), ("translit.", "transliteration",
-                    "aux"), ("usu.", "usually", "aux"), ("zool.", "zoology",
-                    "knl"), ("zoolog.", "zoology", "knl"), ("sth", "something",
-                    "aux"), ("sb", "somebody", "aux")]
-    abbrlist = []
-    for tupple in abbreviations:
-        abbrlist.append(tupple[0])
+    ET = lxml()
     # Get the description from the original header and add information about
     # the conversion.
-    conversion_info = ("_lb_This XDXF file was created automatically by the "
-                      "CedictXML converter, version %s on %s._lb_CedictXML "
-                      "is free and unencumbered software released into the "
-                      "public domain." % (version, currenttime))
-    description = dictionary["header"].replace("\n","_lb_") + conversion_info
-    xdxfdic_top = ET.Element("xdxf", lang_from="CHI", lang_to="ENG",
+    conversion_info = ["This XDXF file was created automatically by the "
+                      "CedictXML converter, version %s on %s." % (version,
+                      currenttime), "CedictXML is free and unencumbered "
+                      "software released into the public domain."]
+    description = header.split("\n") + conversion_info
+    xdxfdic_top = ET.Element("xdxf", lang_from=lang_from, lang_to=lang_to,
                             format="logical", revision="33")
-    # Header is no longer needed, only dictionary entries should be left.
-    del dictionary["header"]
     meta_info = ET.SubElement(xdxfdic_top, "meta_info")
     lexicon = ET.SubElement(xdxfdic_top, "lexicon")
     meta_info_title = ET.SubElement(meta_info, "title").text = dictionaryname
     meta_info_full_title = ET.SubElement(meta_info,
                                         "full_title").text = dictionaryname
     meta_info_publisher = ET.SubElement(meta_info, "publisher").text = "MDBG"
-    meta_info_description = ET.SubElement(meta_info,
-                                         "description").text = description
+    meta_info_description = ET.SubElement(meta_info, "description")
+    meta_info_description.text = description[0]
+    for line in description[1:]:
+        ET.SubElement(meta_info_description, "br").tail = line
     meta_info_abbreviations = ET.SubElement(meta_info, "abbreviations")
     for abbreviation in abbreviations:
         if abbreviation[2] != "":
@@ -421,205 +451,2023 @@ def createxdxf(dictionary):
                                 (meta_info,"publishing_date").text) = (publishing_date_xdxf)
     meta_info_dict_src_url = ET.SubElement(meta_info,
                                           "dict_src_url").text = src_url
-    for key,value in tqdm(dictionary.items()):
-        lexicon_ar = ET.SubElement(lexicon, "ar")
-        lexicon_ar_k = ET.SubElement(lexicon_ar, "k").text = value["entry_jian"]
-        lexicon_ar_k_trad = ET.SubElement(lexicon_ar,
-                                         "k").text = value["entry_fan"]
-        lexicon_ar_def = ET.SubElement(lexicon_ar, "def")
-        lexicon_ar_def_grtr = ET.SubElement(lexicon_ar_def, "gr")
-        lexicon_ar_def_grtr_tr = ET.SubElement(lexicon_ar_def_grtr,
-                                              "tr").text = value["entry_pinyin"]
-        if value.get("entry_taiwan") is not None:
-            lexicon_ar_def_grtr_gr_tw = ET.SubElement(lexicon_ar_def, "gr")
-            lexicon_ar_def_grtr_tr_tw = ET.SubElement(lexicon_ar_def_grtr_gr_tw,
-                                                     "tr").text = value["entry_taiwan"]
-        if value.get("entry_measureword") is not None:
-            # Reassemble the measure words into a string.
-            measurewords = "Measure words:"
-            for item in value["entry_measureword"]:
-                measurewords = measurewords + " " + item
-            lexicon_ar_def_mw = ET.SubElement(lexicon_ar_def,
-                                             "gr").text = measurewords
-        for translation in value["entry_translation"]:
-            lexicon_ar_def_def = ET.SubElement(lexicon_ar_def, "def")
-            # Recognize the abbreviations.
-            for abbreviation in abbrlist:
-                abbreviation_re = r"\b(" + escape(abbreviation) + r")\W|\b(" + escape(abbreviation) + r")$"
-                if len(findall(abbreviation_re,translation)) > 0:
-                    translation = (translation.
-                                  replace(abbreviation, "_lt_abbr_mt_" +
-                                  abbreviation + "_lt_/abbr_mt_"))
-            # Recognize intra-dictionary references.
-            if findall("[Ss]ee ([^\x00-\x7F]+?)[\| \)\.]",
-                         translation) is not []:
-                for item in findall("[Ss]ee ([^\x00-\x7F]+?)[\| \)\.]",
-                                      translation):
-                    translation = translation.replace(item,
-                                                     "_lt_kref_mt_" + item +
-                                                     "_lt_/kref_mt_")
-            if findall("[Ss]ee also ([^\x00-\x7F]+?)[\| \)\.]",
-                         translation) is not []:
-                for item in findall("[Ss]ee also ([^\x00-\x7F]+?)[\| \)\.]",
-                                      translation):
-                    translation = (translation.
-                                  replace(item, "_lt_kref_mt_" + item +
-                                  "_lt_/kref_mt_"))
-            if findall("[Vv]ariant of ([^\x00-\x7F]+?)[\| \)\.]",
-                         translation) is not []:
-                for item in findall("[Vv]ariant of ([^\x00-\x7F]+?)[\| \)\.]",
-                                      translation):
-                    translation = translation.replace(item, "_lt_kref_mt_" +
-                                                     item + "_lt_/kref_mt_")
-            # Recognize external links. Protocol is assumed to be HTTP.
-            if "Planck's constant" not in translation:
-                if len(findall(r"\b([a-zA-Z]{2,}?\.[a-zA-Z0-9][a-zA-Z0-9._]"
-                                 "{2,})\b", translation)) > 0:
-                    for item in findall(r"\b([a-zA-Z]{2,}?\.[a-zA-Z0-9]"
-                                          "[a-zA-Z0-9._]{2,})\b", translation):
-                        translation = (translation.
-                                      replace(item, "_lt_iref href=\"http://" +
-                                      item + "\"_mt_" + item + "_lt_/iref_mt_"))
-            lexicon_ar_def_def_deftext = (ET.SubElement
-                                         (lexicon_ar_def_def,
-                                         "deftext").text) = translation
+    return xdxfdic_top, lexicon
+
+# Intra-dictionary references ("see 詞|词", "see also 詞", "variant of 詞")
+# and external links ("www.mdbg.net"), in one pattern: group 1 is the
+# referenced word, group 2 the link.
+REF_RE = compile(r"\b(?:[Ss]ee(?: also)?|[Vv]ariant of) ([^\x00-\x7F]+?)"
+                 r"(?=[\| \)\.])|"
+                 r"\b([a-zA-Z]{2,}?\.[a-zA-Z0-9][a-zA-Z0-9._]{2,})\b")
+
+def readheadwords(lines):
+    """Return the set of the headwords of CC-CEDICT lines.
+
+    Only the first two fields of the lines accepted by parseentry (see
+    isentry) are kept: this is a quick first pass, so that the
+    cross-references can be checked when the entries are converted one
+    by one (see streamentries), against the same headwords as in
+    dictconvert.
+    """
+    headwords = set()
+    for line in lines:
+        if not line.startswith("#") and isentry(line):
+            headwords.update(line.split(" ", 2)[:2])
+    return headwords
+
+def setheadwords(headwords):
+    """Replace HEADWORDS with the given headwords.
+
+    Used by streamentries, and in the worker processes of
+    poolrenderlines (which, with fork, are given HEADWORDS itself).
+    """
+    if headwords is not HEADWORDS:
+        HEADWORDS.clear()
+        HEADWORDS.update(headwords)
+
+def addmarkup(element, text, markups):
+    """Set the text of an element, with some parts of it as child elements.
+
+    "markups" is a list of (start, end, tag) tuples: each part of the
+    text from start to end becomes a "tag" element (with its "href" for
+    an "iref"), the rest of the text is left as the text of the element
+    and the tails of its children. Where parts overlap, the first one
+    wins.
+    """
+    ET = lxml()
+    # With some text (even empty) before the first child, pretty_print
+    # keeps the children inline, as part of the text.
+    element.text = ""
+    child = None
+    end = 0
+    for markup_start, markup_end, tag in sorted(markups):
+        if markup_start < end:
+            continue
+        if child is None:
+            element.text = text[end:markup_start]
+        else:
+            child.tail = text[end:markup_start]
+        child = ET.SubElement(element, tag)
+        child.text = text[markup_start:markup_end]
+        if tag == "iref":
+            child.set("href", "http://" + child.text)
+        end = markup_end
+    if child is None:
+        element.text = text
+    else:
+        child.tail = text[end:]
+
+def createxdxfentry(value):
+    """Convert a single dictionary entry into an XDXF "ar" element.
+
+    Takes one of the Entry objects provided by dictconvert (or
+    parseentry) and returns the corresponding "ar" element. References
+    to words that are not in HEADWORDS are left as plain text and
+    counted in unresolved_refs (when HEADWORDS is empty, all of them are
+    kept).
+    """
+    ET = lxml()
+    lexicon_ar = ET.Element("ar")
+    lexicon_ar_k = ET.SubElement(lexicon_ar, "k").text = value.entry_jian
+    lexicon_ar_k_trad = ET.SubElement(lexicon_ar,
+                                     "k").text = value.entry_fan
+    lexicon_ar_def = ET.SubElement(lexicon_ar, "def")
+    lexicon_ar_def_grtr = ET.SubElement(lexicon_ar_def, "gr")
+    lexicon_ar_def_grtr_tr = ET.SubElement(lexicon_ar_def_grtr,
+                                          "tr").text = value.entry_pinyin
+    if value.entry_taiwan is not None:
+        lexicon_ar_def_grtr_gr_tw = ET.SubElement(lexicon_ar_def, "gr")
+        lexicon_ar_def_grtr_tr_tw = ET.SubElement(lexicon_ar_def_grtr_gr_tw,
+                                                 "tr").text = value.entry_taiwan
+    if value.entry_measureword is not None:
+        # Reassemble the measure words into a string.
+        measurewords = "Measure words:"
+        for item in value.entry_measureword:
+            measurewords = measurewords + " " + item
+        lexicon_ar_def_mw = ET.SubElement(lexicon_ar_def,
+                                         "gr").text = measurewords
+    for translation in value.entry_translation:
+        lexicon_ar_def_def = ET.SubElement(lexicon_ar_def, "def")
+        lexicon_ar_def_def_deftext = ET.SubElement(lexicon_ar_def_def,
+                                                  "deftext")
+        # Recognize the abbreviations.
+        markups = [(m.start(), m.end(), "abbr")
+                   for m in ABBR_RE.finditer(translation)]
+        # Recognize intra-dictionary references, kept only when they refer
+        # to a headword of the dictionary, and external links (protocol is
+        # assumed to be HTTP).
+        links = "Planck's constant" not in translation
+        for m in REF_RE.finditer(translation):
+            if m.group(1) is None:
+                if links:
+                    markups.append((m.start(2), m.end(2), "iref"))
+            elif not HEADWORDS or m.group(1) in HEADWORDS:
+                markups.append((m.start(1), m.end(1), "kref"))
+            else:
+                global unresolved_refs
+                unresolved_refs += 1
+        addmarkup(lexicon_ar_def_def_deftext, translation, markups)
+    return lexicon_ar
+
+def createxdxf(dictionary):
+    """Convert the dictionary object into a valid XDXF-format string.
+
+    Takes a dictionary in the format provided by dictconvert and
+    returns a string with the whole dictionary content in xml format
+    following the XDXF standard as described in
+    https://github.com/soshial/xdxf_makedict/blob/master/format_standard/xdxf_description.md
+    """
+    xdxfdic_top, lexicon = createxdxfhead(dictionary["header"])
+    # Header is no longer needed, only dictionary entries should be left.
+    del dictionary["header"]
+    for key,value in progress(dictionary.items()):
+        lexicon.append(createxdxfentry(value))
     return xdxfdic_top
 
-def multi_replace(inputstring, replacements):
-    """Apply the replace method multiple times.
+# Size of the blocks handed to the compression thread, and how many of them
+# can wait for it before writing blocks.
+COMPRESS_BLOCK = 1 << 20
+COMPRESS_QUEUE = 8
+# Size of the chunks of a dictzip file: small enough for the compressed
+# chunks to always fit in 16 bits.
+DICTZIP_CHUNK = 58315
+
+class CompressedOutput(object):
+    """A binary output file compressed on a background thread.
 
-    "inputstring" is self-explanatory, "replacements" is a list of
-    tuples, the fist item of each tuple the substring to be replaced
-    and the second the replacement text.
+    What is written is gathered in blocks of COMPRESS_BLOCK bytes, which
+    are handed to the thread through a queue of at most COMPRESS_QUEUE
+    blocks: the compression (zlib and lzma let other threads run while
+    they work) overlaps with the conversion, and a slow compressor
+    holds up the writes instead of filling the memory.
+
+    "kind" is "gz" (gzip), "xz" or "dz" (dictzip: a gzip file compressed
+    in independent chunks, with the size of every compressed chunk in
+    the "RA" extra field of the header, so that dictionary programs can
+    read any part of it without decompressing the rest; any gzip tool
+    can still decompress it). A dictzip file is written to
+    filename + ".part" first, since its header can only be written once
+    all the chunks are compressed. tell() gives the position in the
+    uncompressed data.
     """
-    for replacement in replacements:
-        inputstring = inputstring.replace(replacement[0], replacement[1])
-    return inputstring
 
-if __name__=='__main__':
+    def __init__(self, filename, kind):
+        from threading import Thread
+        from queue import Queue
+        self.name = filename
+        self.kind = kind
+        if kind == "dz":
+            self.outputfile = open(filename + ".part", "wb")
+        else:
+            self.outputfile = open(filename, "wb")
+        self.blocks = []
+        self.buffered = 0
+        self.position = 0
+        self.error = None
+        self.queue = Queue(COMPRESS_QUEUE)
+        self.thread = Thread(target=self.compress)
+        self.thread.daemon = True
+        self.thread.start()
 
-    PINYIN_RE = compile(r'(([bcdfghjklmnpqrstwxyz]*)(u:an|u:|u:e|[aeiou]+)([bcdfghjklmnpqrstwxyz]*)|r)([1-5])', I)
-    
-    TONE_MARKS = {
-        'a':u'_āáǎàa',
-        'e':u'_ēéěèe',
-        'i':u'_īíǐìi',
-        'o':u'_ōóǒòo',
-        'u':u'_ūúǔùu',
-        'u:':u'_ǖǘǚǜü'
-    }
-    
-    # use upper() to get the upper case versions
-    TONE_MARKS['A'] = TONE_MARKS['a'].upper()
-    TONE_MARKS['E'] = TONE_MARKS['e'].upper()
-    TONE_MARKS['I'] = TONE_MARKS['i'].upper()
-    TONE_MARKS['O'] = TONE_MARKS['o'].upper()
-    TONE_MARKS['U'] = TONE_MARKS['u'].upper()
-    TONE_MARKS['U:'] = TONE_MARKS['u:'].upper()
-    
-    ALL_SOUNDS = set(['a', 'ai', 'an', 'ang', 'ao', 'ba', 'bai', 'ban', 'bang',
-        'bao', 'bei', 'ben', 'beng', 'bi', 'bian', 'biao', 'bie', 'bin', 'bing',
-        'bo', 'bu', 'ca', 'cai', 'can', 'cang', 'cao', 'ce', 'cen', 'ceng', 'cha',
-        'chai', 'chan', 'chang', 'chao', 'che', 'chen', 'cheng', 'chi', 'chong',
-        'chou', 'chu', 'chuai', 'chuan', 'chuang', 'chui', 'chun', 'chuo', 'ci',
-        'cong', 'cou', 'cu', 'cuan', 'cui', 'cun', 'cuo', 'da', 'dai', 'dan',
-        'dang', 'dao', 'de', 'dei', 'den', 'deng', 'di', 'dian', 'diao', 'die',
-        'ding', 'diu', 'dong', 'dou', 'du', 'duan', 'dui', 'dun', 'duo', 'e', 'en',
-        'er', 'fa', 'fan', 'fang', 'fei', 'fen', 'feng', 'fo', 'fou', 'fu', 'ga',
-        'gai', 'gan', 'gang', 'gao', 'ge', 'gei', 'gen', 'geng', 'gong', 'gou',
-        'gu', 'gua', 'guai', 'guan', 'guang', 'gui', 'gun', 'guo', 'ha', 'hai',
-        'han', 'hang', 'hao', 'he', 'hei', 'hen', 'heng', 'hong', 'hou', 'hu',
-        'hua', 'huai', 'huan', 'huang', 'hui', 'hun', 'huo', 'ji', 'jia', 'jian',
-        'jiang', 'jiao', 'jie', 'jin', 'jing', 'jiong', 'jiu', 'ju', 'juan', 'jue',
-        'jun', 'ka', 'kai', 'kan', 'kang', 'kao', 'ke', 'ken', 'keng', 'kong',
-        'kou', 'ku', 'kua', 'kuai', 'kuan', 'kuang', 'kui', 'kun', 'kuo', 'la',
-        'lai', 'lan', 'lang', 'lao', 'le', 'lei', 'leng', 'li', 'lia', 'lian',
-        'liang', 'liao', 'lie', 'lin', 'ling', 'liu', 'long', 'lou', 'lu', 'luan',
-        'lun', 'luo', 'lu:', 'lu:an', 'lu:e', 'ma', 'mai',     'man', 'mang', 'mao',
-        'me', 'mei', 'men', 'meng', 'mi', 'mian', 'miao',     'mie', 'min', 'ming',
-        'miou', 'mo', 'mou', 'mu', 'na', 'nai', 'nan',     'nang', 'nao', 'ne', 'nei',
-        'nen', 'neng', 'ni', 'nian', 'niang', 'niao',     'nie', 'nin', 'ning', 'niu',
-        'nong', 'nou', 'nu', 'nuan', 'nuo',     'nu:', 'nu:e', 'ou', 'pa', 'pai', 'pan',
-        'pang', 'pao', 'pei', 'pen',     'peng', 'pi', 'pian', 'piao', 'pie', 'pin',
-        'ping', 'po', 'pou', 'pu', 'qi',     'qia', 'qian', 'qiang', 'qiao', 'qie',
-        'qin', 'qing', 'qiong', 'qiu', 'qu',     'quan', 'que', 'qun', 'r', 'ran',
-        'rang', 'rao', 're', 'ren', 'reng', 'ri',     'rong', 'rou', 'ru', 'ruan',
-        'rui', 'run', 'ruo', 'sa', 'sai', 'san',     'sang', 'sao', 'se', 'sen', 'seng',
-        'sha', 'shai', 'shan', 'shang', 'shao',     'she', 'shei', 'shen', 'sheng',
-        'shi', 'shou', 'shu', 'shua', 'shuai',     'shuan', 'shuang', 'shui', 'shun',
-        'shuo', 'si', 'song', 'sou', 'su',     'suan', 'sui', 'sun', 'suo', 'ta', 'tai',
-        'tan', 'tang', 'tao', 'te',     'teng', 'ti', 'tian', 'tiao', 'tie', 'ting',
-        'tong', 'tou', 'tu', 'tuan',     'tui', 'tun', 'tuo', 'wa', 'wai', 'wan',
-        'wang', 'wei', 'wen', 'weng', 'wo',     'wu', 'xi', 'xia', 'xian', 'xiang',
-        'xiao', 'xie', 'xin', 'xing', 'xiong',     'xiu', 'xu', 'xuan', 'xue', 'xun',
-        'ya', 'yan', 'yang', 'yao', 'ye', 'yi',     'yin', 'ying', 'yong', 'you', 'yu',
-        'yuan', 'yue', 'yun', 'za', 'zai',     'zan', 'zang', 'zao', 'ze', 'zen',
-        'zeng', 'zha', 'zhai', 'zhan', 'zhang',     'zhao', 'zhe', 'zhen', 'zheng',
-        'zhi', 'zhong', 'zhou', 'zhu', 'zhua',     'zhuai', 'zhuan', 'zhuang', 'zhui',
-        'zhun', 'zhuo', 'zi', 'zong', 'zou',     'zu', 'zuan', 'zui', 'zun', 'zuo'])
-
-    version = "1.2"
-    dictionaryname = "CC-CEDICT"
-    currenttime = strftime("%d-%m-%Y %H:%M:%S", localtime())
-    dtd_url = "https://raw.github.com/soshial/xdxf_makedict/master/format_standard/xdxf_strict.dtd"
-    doctypestring = "<!DOCTYPE xdxf SYSTEM \'%s\'>" % dtd_url
-    declaration = ("CedictXML: CC-CEDICT to XDXF Converter\nVersion %s\n" % version)
-    header = ""
-    src_url = "http://www.mdbg.net/chindict/chindict.php?page=cc-cedict"
-    file_url = "https://www.mdbg.net/chinese/export/cedict/cedict_1_0_ts_utf-8_mdbg.zip"
-    publishing_date = ""
-    dictionary_version = ""
-    cedict_dict = dict()    # Final dictionary object
+    def write(self, data):
+        self.blocks.append(data)
+        self.buffered += len(data)
+        self.position += len(data)
+        if self.buffered >= COMPRESS_BLOCK:
+            self.queue.put(b"".join(self.blocks))
+            self.blocks = []
+            self.buffered = 0
+
+    def tell(self):
+        return self.position
+
+    def close(self):
+        """Compress what is left and close the file."""
+        self.queue.put(b"".join(self.blocks))
+        self.blocks = []
+        self.queue.put(None)
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def compress(self):
+        """Compress the blocks of the queue until None comes."""
+        from lzma import LZMACompressor
+        if self.kind == "xz":
+            self.compressor = LZMACompressor()
+        elif self.kind == "dz":
+            self.compressor = compressobj(9, DEFLATED, -15)
+            self.crc = 0
+            self.size = 0
+            self.sizes = []
+            self.pending = b""
+        else:
+            # wbits 31: with a gzip header and trailer.
+            self.compressor = compressobj(9, DEFLATED, 31)
+        for block in iter(self.queue.get, None):
+            # After an error, the queue is still emptied so that write and
+            # close never block.
+            if self.error is None:
+                try:
+                    self.compressblock(block)
+                except Exception as error:
+                    self.error = error
+        if self.error is None:
+            try:
+                self.finish()
+            except Exception as error:
+                self.error = error
+        self.outputfile.close()
+
+    def compressblock(self, block):
+        if self.kind != "dz":
+            self.outputfile.write(self.compressor.compress(block))
+            return
+        pending = self.pending + block
+        start = 0
+        while len(pending) - start > DICTZIP_CHUNK:
+            self.compresschunk(pending[start:start + DICTZIP_CHUNK],
+                               Z_FULL_FLUSH)
+            start += DICTZIP_CHUNK
+        self.pending = pending[start:]
+
+    def compresschunk(self, chunk, flush):
+        """Compress a chunk of a dictzip file, starting a new block."""
+        self.crc = crc32(chunk, self.crc)
+        self.size += len(chunk)
+        compressed = (self.compressor.compress(chunk) +
+                      self.compressor.flush(flush))
+        self.sizes.append(len(compressed))
+        self.outputfile.write(compressed)
+
+    def finish(self):
+        if self.kind != "dz":
+            self.outputfile.write(self.compressor.flush())
+            return
+        from shutil import copyfileobj
+        # The last chunk (possibly empty) ends the deflate stream.
+        self.compresschunk(self.pending, Z_FINISH)
+        self.outputfile.close()
+        chunks = len(self.sizes)
+        if chunks > 32762:
+            remove(self.name + ".part")
+            raise ValueError("\"%s\" is too large for dictzip." % self.name)
+        extra = (b"RA" + pack("<HHHH", 6 + 2 * chunks, 1, DICTZIP_CHUNK,
+                              chunks) + pack("<%dH" % chunks, *self.sizes))
+        dzfile = open(self.name, "wb")
+        dzfile.write(pack("<BBBBIBBH", 0x1f, 0x8b, 8, 4, int(time()), 2, 3,
+                          len(extra)) + extra)
+        partfile = open(self.name + ".part", "rb")
+        copyfileobj(partfile, dzfile)
+        partfile.close()
+        dzfile.write(pack("<II", self.crc, self.size & 0xffffffff))
+        dzfile.close()
+        remove(self.name + ".part")
+
+# Extensions of the output files compressed by openoutput, and the magic
+# bytes such files start with (dictzip files are gzip files).
+COMPRESSED_EXTENSIONS = (".gz", ".xz", ".dz")
+COMPRESSED_MAGIC = (b"\x1f\x8b", b"\xfd7zXZ\x00")
+
+def iscompressed(filename):
+    """Whether openoutput compresses a file with this name."""
+    return splitext(filename)[1].lower() in COMPRESSED_EXTENSIONS
+
+def openoutput(filename):
+    """Open an output file, compressed according to its extension.
+
+    Files ending in ".gz", ".xz" or ".dz" are compressed while they are
+    written (see CompressedOutput), others are plain binary files.
+    """
+    extension = splitext(filename)[1].lower()
+    if extension in COMPRESSED_EXTENSIONS:
+        return CompressedOutput(filename, extension[1:])
+    return open(filename, "wb")
+
+def openxdxf(header, output_file=None, empty=False, lang_from="CHI",
+             lang_to="ENG"):
+    """Open the output XDXF file and write everything before the entries.
+
+    Returns the open file and the text that has to be written after the
+    last entry to close the document. See createxdxfhead for "lang_from"
+    and "lang_to".
+    """
+    ET = lxml()
+    parseheader(header)
+    if output_file is None:
+        output_file = "CC-CEDICT_" + dictionary_version + ".xdxf"
+    xdxfdic_top, lexicon = createxdxfhead(header, lang_from, lang_to)
+    xdxf_frame = ET.tostring(xdxfdic_top, encoding="utf-8", pretty_print=True,
+                            xml_declaration=True, doctype=doctypestring)
+    xdxf_head, xdxf_tail = xdxf_frame.split(b"<lexicon/>")
+    xdxffile = openoutput(output_file)
+    if empty:
+        xdxffile.write(xdxf_head + b"<lexicon/>")
+        return xdxffile, xdxf_tail
+    xdxffile.write(xdxf_head + b"<lexicon>\n")
+    return xdxffile, b"  </lexicon>" + xdxf_tail
+
+# A hand-written subset of xdxf_strict.dtd (the DTD of dtd_url), limited to
+# what createxdxfentry writes, so that the articles can be checked without
+# network access. It is not the upstream file: see the comment at its top.
+# It is kept next to this file, or in share/cedictxml once installed (see
+# setup.py).
+DTD_FILE = join(dirname(abspath(__file__)), "xdxf_subset.dtd")
+if not exists(DTD_FILE):
+    DTD_FILE = join(prefix, "share", "cedictxml", "xdxf_subset.dtd")
+
+def setvalidation(enabled=True):
+    """Check every article rendered from now on (see checkarticle)."""
+    global article_dtd
+    if enabled:
+        ET = lxml()
+        article_dtd = ET.DTD(DTD_FILE)
+    else:
+        article_dtd = None
+
+def checkarticle(element):
+    """Check an "ar" element against the rules of xdxf_subset.dtd.
+
+    Only the element and its children are checked, against the
+    declarations of the DTD (see DTD_FILE). The element is checked as
+    it is created, before it is serialized, so that the article does
+    not have to be parsed again. The errors found are left in
+    article_errors (empty if the article is valid).
+    """
+    global article_errors
+    if article_dtd.validate(element):
+        article_errors = []
+    else:
+        article_errors = []
+        for error in article_dtd.error_log.filter_from_errors():
+            if error.message not in article_errors:
+                article_errors.append(error.message)
+
+def renderxdxfentry(entry):
+    """Convert a single dictionary entry into XDXF text.
+
+    Returns the text (UTF-8 bytes) of the "ar" element created by
+    createxdxfentry, indented as it would be inside the whole XDXF tree.
+    The element is checked first if setvalidation was called.
+    """
+    ET = lxml()
+    xdxf_ar = createxdxfentry(entry)
+    if article_dtd is not None:
+        checkarticle(xdxf_ar)
+    xdxf_ar = ET.tostring(xdxf_ar, encoding="utf-8", pretty_print=True)
+    return b"    " + xdxf_ar[:-1].replace(b"\n", b"\n    ") + b"\n"
+
+def renderlines(lines, start=0, render=renderxdxfentry):
+    """Parse CC-CEDICT lines and convert their entries into XDXF text.
+
+    Yields a (linenum, header, xdxf_ar, headword, unresolved) tuple for
+    every useful line: header is the header text of a header line (None
+    for entries), xdxf_ar the text returned by "render"
+    (renderxdxfentry by default) for an entry, headword its
+    (simplified, traditional, pinyin) tuple and unresolved the number of
+    its references to words that are not headwords (None, None and 0
+    for header lines). See iterentries for "start".
+    """
+    return renderentries(iterentries(lines, start), render)
+
+def renderentries(entries, render=renderxdxfentry):
+    """Render the (linenum, entry) tuples yielded by iterentries.
+
+    Yields the tuples of renderlines. If the articles are checked (see
+    setvalidation), the invalid ones are reported with their line and
+    counted in invalid_articles.
+    """
+    global invalid_articles
+    for linenum, entry in entries:
+        if isinstance(entry, str):
+            yield linenum, entry, None, None, 0
+        else:
+            before = unresolved_refs
+            article = render(entry)
+            if article_dtd is not None and article_errors:
+                invalid_articles += 1
+                print ("Line %s (%s) is not valid XDXF: %s" % (linenum,
+                       entry.entry_jian, "; ".join(article_errors)))
+            yield linenum, None, article, (entry.entry_jian,
+                                           entry.entry_fan,
+                                           entry.entry_pinyin), (
+                unresolved_refs - before)
+
+def chunklines(lines, size):
+    """Split lines into chunks of "size" lines.
+
+    Yields (start, lines) tuples, "start" being the number of lines
+    before the chunk.
+    """
+    start = 0
+    chunk = []
+    for line in lines:
+        chunk.append(line)
+        if len(chunk) == size:
+            yield start, chunk
+            start = start + size
+            chunk = []
+    if len(chunk) > 0:
+        yield start, chunk
+
+def renderchunk(chunk):
+    """Run renderlines over a (start, lines, render) chunk in a worker.
+
+    Returns everything renderlines yields, as a list.
+    """
+    start, lines, render = chunk
+    return list(renderlines(lines, start, render))
+
+def poolrenderlines(lines, jobs, chunksize=2000, render=renderxdxfentry):
+    """Same as renderlines, with the work split among processes.
+
+    The lines are cut into chunks of "chunksize" lines, which are
+    parsed and converted by a pool of "jobs" worker processes. The
+    results are yielded in the original order of the lines, exactly as
+    renderlines would yield them. Only the text of the header lines is
+    sent back by the workers: the publishing date and version are
+    worked out from it by the main process. The workers are given the
+    HEADWORDS of the main process.
+    """
+    from multiprocessing import Pool
+    with Pool(jobs, setheadwords, (HEADWORDS,)) as pool:
+        chunks = ((start, chunk, render)
+                  for start, chunk in chunklines(lines, chunksize))
+        for rendered in pool.imap(renderchunk, chunks):
+            for item in rendered:
+                yield item
+
+def pipelinestage(name, batches, work, output, stats, errors, stop,
+                  reading=False):
+    """Run one stage of pipelinelines, in its own thread.
+
+    Every batch given by batches() (None when there are no more) goes
+    through work and the result is put in the "output" queue, followed
+    by None at the end. The time spent in work is recorded as busy in
+    stats["stages"][name], the time spent waiting for a batch as idle
+    (as busy for the reader, "reading" being true, whose batches() is
+    the reading itself) and the time spent waiting for room in the
+    output queue as blocked. The depth of the output queue is recorded
+    in stats["queues"][name]. Errors are appended to "errors". After an
+    error, or once something is in "stop", the batches are only taken
+    and dropped (and the reader stops reading), so that no stage is
+    left waiting for room in a queue.
+    """
+    stage = stats["stages"][name] = {"batches": 0, "busy": 0.0,
+                                     "idle": 0.0, "blocked": 0.0}
+    queue = stats["queues"][name] = {"max_depth": 0, "mean_depth": 0.0}
+    depths = 0
+    try:
+        while True:
+            start = perf_counter()
+            batch = batches()
+            got = perf_counter()
+            if batch is None:
+                stage["idle" if not reading else "busy"] += got - start
+                break
+            if errors or stop:
+                if reading:
+                    break
+                continue
+            result = work(batch)
+            done = perf_counter()
+            output.put(result)
+            end = perf_counter()
+            depth = output.qsize()
+            stage["idle" if not reading else "busy"] += got - start
+            stage["busy"] += done - got
+            stage["blocked"] += end - done
+            stage["batches"] += 1
+            depths += depth
+            queue["max_depth"] = max(queue["max_depth"], depth)
+    except Exception as error:
+        errors.append(error)
+        if not reading:
+            while batches() is not None:
+                pass
+    finally:
+        output.put(None)
+        if stage["batches"]:
+            queue["mean_depth"] = depths / stage["batches"]
+
+def pipelinelines(lines, render=renderxdxfentry, batchsize=1000, depth=8,
+                  stats=None):
+    """Same as renderlines, with the work split among pipelined threads.
+
+    A reader thread cuts the lines into batches of "batchsize" lines, a
+    parser thread runs iterentries over them and a renderer thread
+    renders the entries: the batches are passed from one to the next
+    through queues of at most "depth" batches, the writer taking them
+    from the last one. Only one thread at a time can run Python code,
+    so parsing and rendering do not run in parallel, but the reading
+    and the writing (and the compression, see CompressedOutput) happen
+    while they work.
+
+    If "stats" is given, the busy, idle and blocked time of every stage
+    and the depth of every queue (see pipelinestage) are saved in it,
+    the writer being the "write" stage: its busy time is the time spent
+    by the code using the tuples yielded.
+    """
+    from threading import Thread
+    from queue import Queue
+    if stats is None:
+        stats = {}
+    stats["stages"] = {}
+    stats["queues"] = {}
+    errors = []
+    stop = []
+    chunks = chunklines(lines, batchsize)
+    read, parsed, rendered = Queue(depth), Queue(depth), Queue(depth)
+    # The queues are emptied in turn: a None from one means that the
+    # previous stage is done.
+    threads = [Thread(target=pipelinestage,
+                      args=("read", lambda: next(chunks, None),
+                            lambda chunk: chunk, read, stats, errors, stop,
+                            True)),
+               Thread(target=pipelinestage,
+                      args=("parse", read.get,
+                            lambda chunk: list(iterentries(chunk[1],
+                                                           chunk[0])),
+                            parsed, stats, errors, stop)),
+               Thread(target=pipelinestage,
+                      args=("render", parsed.get,
+                            lambda batch: list(renderentries(batch, render)),
+                            rendered, stats, errors, stop))]
+    for thread in threads:
+        thread.daemon = True
+        thread.start()
+    write = stats["stages"]["write"] = {"batches": 0, "busy": 0.0,
+                                        "idle": 0.0, "blocked": 0.0}
+    batch = []
+    try:
+        while True:
+            start = perf_counter()
+            batch = rendered.get()
+            write["idle"] += perf_counter() - start
+            if batch is None:
+                break
+            start = perf_counter()
+            for item in batch:
+                yield item
+            write["busy"] += perf_counter() - start
+            write["batches"] += 1
+    finally:
+        # Also when the writer stops early: let the stages finish.
+        stop.append(True)
+        while batch is not None:
+            batch = rendered.get()
+        for thread in threads:
+            thread.join()
+    if errors:
+        raise errors[0]
+
+# To be changed whenever the XDXF text of the entries changes, so that the
+# caches made by older versions are not used.
+CACHE_FORMAT = 3
+
+def opencache(filename, render=renderxdxfentry):
+    """Open (or create) the cache of converted entries.
+
+    The cache is an SQLite database keeping, for every line of the
+    CC-CEDICT file converted last time, a hash of the line, its headword
+    ("Traditional Simplified [pin1 yin1]") and its text, as rendered by
+    "render". It is only valid for the version of the converter, the
+    list of abbreviations and the output format that produced it: when
+    any of them changes, the rendered texts are dropped (but the lines
+    are kept, so that the changelog still shows the changes from one
+    release to the next). The number of unresolved references of every
+    entry and the HEADWORDS of the last conversion are kept as well (see
+    cachedrenderlines).
+    """
+    from sqlite3 import connect
+    from hashlib import sha1
+    cache = connect(filename)
+    cache.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, "
+                  "value TEXT)")
+    cache.execute("CREATE TABLE IF NOT EXISTS entries (hash TEXT PRIMARY KEY, "
+                  "headword TEXT, ar BLOB, run INTEGER)")
+    columns = [row[1] for row in cache.execute("PRAGMA table_info(entries)")]
+    if "unresolved" not in columns:
+        cache.execute("ALTER TABLE entries ADD COLUMN unresolved INTEGER")
+    rules = sha1(repr((version, CACHE_FORMAT, abbreviations,
+                       render.__name__)).
+                 encode("utf8")).hexdigest()
+    meta = dict(cache.execute("SELECT key, value FROM meta"))
+    if meta.get("rules") != rules:
+        cache.execute("UPDATE entries SET ar = NULL")
+    run = int(meta.get("run", 0)) + 1
+    cache.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?)",
+                      [("rules", rules), ("run", str(run))])
+    return cache
+
+def cachedrenderlines(lines, cache, changes, render=renderxdxfentry):
+    """Same as renderlines, reusing the rendered text of unchanged lines.
+
+    Lines found in the cache (see opencache) are not parsed again, new or
+    changed lines are converted and added to it. The headwords of the new
+    lines are appended to the "changes" list. Since the references of an
+    entry depend on the other headwords, unchanged lines mentioning a
+    headword added or removed since the last conversion are converted
+    again.
+    """
+    from hashlib import sha1
+    meta = dict(cache.execute("SELECT key, value FROM meta"))
+    run = int(meta["run"])
+    if "headwords" in meta:
+        changed = set(meta["headwords"].split("\n")) ^ HEADWORDS
+        changed.discard("")
+    else:
+        changed = None
+    if changed:
+        changed_re = compile(trieregex(changed))
+    cache.execute("INSERT OR REPLACE INTO meta VALUES ('headwords', ?)",
+                  ("\n".join(sorted(HEADWORDS)),))
+    linenum = int(0)
+    for line in lines:
+        linenum = linenum + 1
+        line = line.rstrip("\n")
+        if line.startswith("#"):
+            for item in renderlines([line], linenum - 1, render):
+                yield item
+            continue
+        key = sha1(line.encode("utf8")).hexdigest()
+        cached = cache.execute("SELECT ar, unresolved FROM entries "
+                               "WHERE hash = ?", (key,)).fetchone()
+        if (cached is not None and cached[0] is not None and
+                changed is not None and
+                not (changed and changed_re.search(line))):
+            cache.execute("UPDATE entries SET run = ? WHERE hash = ?",
+                          (run, key))
+            fan, jian, pinyin = line.split(" /", 1)[0].split(" ", 2)
+            # The same pinyin as parseentry gives, for the sort keys.
+            yield linenum, None, cached[0], (jian, fan,
+                                             pyjoin(pinyin[1:-1])), (
+                cached[1])
+            continue
+        for item in renderlines([line], linenum - 1, render):
+            headword = line.split(" /", 1)[0]
+            cache.execute("INSERT OR REPLACE INTO entries (hash, headword, "
+                          "ar, run, unresolved) VALUES (?, ?, ?, ?, ?)",
+                          (key, headword, item[2], run, item[4]))
+            if cached is None:
+                changes.append(headword)
+            yield item
+
+def closecache(cache, changes, changelog=None):
+    """Forget the lines that are gone and close the cache.
+
+    The lines of the last conversion missing from this one are removed
+    from the cache. If "changelog" is given, the headwords added (+),
+    removed (-) and modified (~) since the last conversion are written
+    to that file.
+    """
+    run = int(cache.execute("SELECT value FROM meta WHERE key = 'run'").
+              fetchone()[0])
+    removed = [row[0] for row in cache.execute("SELECT headword FROM entries "
+                                               "WHERE run != ?", (run,))]
+    cache.execute("DELETE FROM entries WHERE run != ?", (run,))
+    cache.commit()
+    cache.close()
+    if changelog is not None:
+        added = set(changes)
+        gone = set(removed)
+        changelogfile = open(changelog, "w", encoding="utf8")
+        for headword in changes:
+            if headword in gone:
+                changelogfile.write("~ " + headword + "\n")
+            else:
+                changelogfile.write("+ " + headword + "\n")
+        for headword in removed:
+            if headword not in added:
+                changelogfile.write("- " + headword + "\n")
+        changelogfile.close()
+
+class XdxfWriter(object):
+    """Write the entries coming from streamentries to an XDXF file.
+
+    The entries are rendered with renderxdxfentry. If "index" is given,
+    a lookup index of the entries is written to that file as well (see
+    writeindex).
+    """
+    render = staticmethod(renderxdxfentry)
+
+    def __init__(self, output_file=None, index=None):
+        if index is not None and output_file and iscompressed(output_file):
+            # The index gives offsets in the uncompressed text.
+            raise ValueError("An index can only be written with an "
+                             "uncompressed XDXF file.")
+        self.output_file = output_file
+        self.index = index
+        self.records = []
+
+    def open(self, header, empty=False):
+        """Write everything before the entries."""
+        self.xdxffile, self.tail = openxdxf(header, self.output_file, empty)
+        self.offset = self.xdxffile.tell()
+
+    def write(self, xdxf_ar, headword):
+        """Write an entry rendered by renderxdxfentry."""
+        if self.index is not None:
+            # The indentation is not part of the "ar" element.
+            for key in indexkeys(*headword):
+                self.records.append((key, self.offset + 4, len(xdxf_ar) - 5))
+            self.offset += len(xdxf_ar)
+        self.xdxffile.write(xdxf_ar)
+
+    def close(self):
+        """Finish the file (and the index). Returns the file name."""
+        self.xdxffile.write(self.tail)
+        self.xdxffile.close()
+        if self.index is not None:
+            writeindex(self.index, self.records)
+        return self.xdxffile.name
+
+def renderstardictentry(entry):
+    """Convert a single dictionary entry into a StarDict article.
+
+    Returns the UTF-8 bytes of the "ar" element created by
+    createxdxfentry without the "ar" tags themselves: StarDict articles
+    of type "x" are XDXF markup. The element is checked first if
+    setvalidation was called.
+    """
+    ET = lxml()
+    xdxf_ar = createxdxfentry(entry)
+    if article_dtd is not None:
+        checkarticle(xdxf_ar)
+    return ET.tostring(xdxf_ar, encoding="utf-8")[4:-5]
+
+class StardictWriter(object):
+    """Write the entries coming from streamentries to a StarDict dictionary.
+
+    The articles go to the .dict file as they come. The simplified
+    headwords and the position of their articles are kept and written,
+    sorted as StarDict expects them, to the .idx file at the end, with
+    the traditional headwords in the .syn file. The .dict file is
+    compressed with dictzip while it is written (see CompressedOutput),
+    unless "compress" is False. "output_file"
+    is the name of the .ifo file (the other files take the same name
+    with their own extension).
+    """
+    render = staticmethod(renderstardictentry)
+
+    def __init__(self, output_file=None, compress=True):
+        self.output_file = output_file
+        self.compress = compress
+        self.words = []
+        self.synonyms = []
+
+    def open(self, header, empty=False):
+        """Open the .dict file."""
+        parseheader(header)
+        if self.output_file is None:
+            self.name = "CC-CEDICT_" + dictionary_version
+        else:
+            self.name = splitext(self.output_file)[0]
+        if self.compress:
+            self.dictfile = openoutput(self.name + ".dict.dz")
+        else:
+            self.dictfile = openoutput(self.name + ".dict")
+        self.offset = 0
+
+    def write(self, article, headword):
+        """Write an article rendered by renderstardictentry."""
+        jian, fan, pinyin = headword
+        if fan != jian:
+            self.synonyms.append((fan.encode("utf8"), len(self.words)))
+        self.words.append((jian.encode("utf8"), self.offset, len(article)))
+        self.dictfile.write(article)
+        self.offset += len(article)
+
+    def close(self):
+        """Write the .idx, .syn and .ifo files. Returns the .ifo name."""
+        self.dictfile.close()
+        # StarDict sorts the words case-insensitively (for ASCII letters
+        # only), then byte by byte.
+        order = sorted(range(len(self.words)),
+                       key=lambda word: (self.words[word][0].lower(),
+                                         self.words[word][0]))
+        position = [0] * len(order)
+        idxfile = open(self.name + ".idx", "wb")
+        for number, word in enumerate(order):
+            position[word] = number
+            word, offset, size = self.words[word]
+            idxfile.write(word + b"\0" + STARDICT_IDX.pack(offset, size))
+        idxfilesize = idxfile.tell()
+        idxfile.close()
+        synfile = open(self.name + ".syn", "wb")
+        for synonym, word in sorted(self.synonyms,
+                                    key=lambda synonym: (synonym[0].lower(),
+                                                         synonym[0])):
+            synfile.write(synonym + b"\0" + STARDICT_SYN.pack(position[word]))
+        synfile.close()
+        ifo = ["StarDict's dict ifo file",
+               "version=2.4.2",
+               "bookname=" + dictionaryname,
+               "wordcount=%d" % len(self.words),
+               "synwordcount=%d" % len(self.synonyms),
+               "idxfilesize=%d" % idxfilesize,
+               "author=MDBG",
+               "website=" + src_url,
+               "description=%s %s, converted by CedictXML %s on %s." %
+               (dictionaryname, publishing_date, version, currenttime),
+               "date=" + publishing_date.replace("-", "."),
+               "sametypesequence=x"]
+        ifofile = open(self.name + ".ifo", "w", encoding="utf8", newline="\n")
+        ifofile.write("\n".join(ifo) + "\n")
+        ifofile.close()
+        return self.name + ".ifo"
+
+# Offset and size of an article (.idx), number of a word (.syn).
+STARDICT_IDX = Struct(">II")
+STARDICT_SYN = Struct(">I")
+def streamentries(lines, writer, jobs=1, cache=None, changes=None,
+                  counts=None, pipeline=None, headwords=None):
+    """Convert CC-CEDICT lines entry by entry with a writer.
+
+    Unlike dictconvert and createxdxf, neither the CC-CEDICT dictionary
+    nor the converted dictionary is ever held in memory as a whole:
+    every line is parsed, rendered with writer.render and handed to
+    writer.write straight away, so memory use does not depend on the
+    size of the dictionary (see XdxfWriter and StardictWriter).
+
+    The header is taken from the "#" lines preceding the first entry
+    (the publishing date is needed to write the meta information, and
+    for the default file name, before any entry can be written) and
+    given to writer.open. With "jobs" greater than 1, the lines are
+    parsed and rendered by that many processes (see poolrenderlines).
+    With a "cache" (see opencache), only the lines that are not in the
+    cache are rendered (see cachedrenderlines). Without either, with a
+    "pipeline" dictionary, the lines are read, parsed and rendered by
+    pipelined threads (see pipelinelines): pipeline["batchsize"] and
+    pipeline["depth"] give the size of the batches and the depth of the
+    queues, and the statistics of the stages are saved in it. If
+    "counts" is given, the number of entries written is added to
+    counts["entries"] and the number of unresolved references to
+    counts["unresolved_refs"].
+
+    The cross-references are checked against "headwords", the set of
+    the headwords of the dictionary (see readheadwords), which replaces
+    HEADWORDS for the conversion. If it is not given, it is read from
+    "lines" first when these can be iterated twice (a list, for
+    instance); with an open file or another iterator, which can only
+    be read once, no references are checked and all of them are kept.
+    Returns what writer.close returns, the name of the output file.
+    """
+    if headwords is None:
+        headwords = readheadwords(lines) if iter(lines) is not lines else ()
+    setheadwords(headwords)
+    if cache is not None:
+        rendered = cachedrenderlines(lines, cache, changes, writer.render)
+    elif jobs > 1:
+        rendered = poolrenderlines(lines, jobs, render=writer.render)
+    elif pipeline is not None:
+        rendered = pipelinelines(lines, writer.render, pipeline["batchsize"],
+                                 pipeline["depth"], pipeline)
+    else:
+        rendered = renderlines(lines, render=writer.render)
+    header = str()
+    opened = False
+    entries = 0
+    unresolved = 0
+    for linenum, entry_header, article, headword, refs in progress(rendered):
+        if entry_header is not None:
+            if not opened:
+                header = header + entry_header
+            continue
+        if not opened:
+            writer.open(header)
+            opened = True
+        writer.write(article, headword)
+        entries += 1
+        unresolved += refs
+    if counts is not None:
+        counts["entries"] += entries
+        counts["unresolved_refs"] += unresolved
+    if not opened:
+        # No entries at all: write an empty dictionary, as createxdxf would.
+        writer.open(header, empty=True)
+    return writer.close()
+
+def streamxdxf(lines, output_file=None, jobs=1, cache=None, changes=None,
+               counts=None, index=None, headwords=None):
+    """Convert CC-CEDICT lines to an XDXF file entry by entry.
+
+    The resulting file is identical to the one produced by createxdxf,
+    provided that the headwords are known (given as "headwords", or
+    read from "lines" when these are a list, see streamentries). If
+    "index" is given, a lookup index of the entries is written to that
+    file (see writeindex). See streamentries for the other arguments.
+    Returns the name of the output file.
+    """
+    return streamentries(lines, XdxfWriter(output_file, index), jobs, cache,
+                         changes, counts, headwords=headwords)
+
+def streamstardict(lines, output_file=None, jobs=1, cache=None, changes=None,
+                   counts=None, compress=True, headwords=None):
+    """Convert CC-CEDICT lines to a StarDict dictionary entry by entry.
+
+    See StardictWriter and streamentries. Returns the name of the .ifo
+    file.
+    """
+    return streamentries(lines, StardictWriter(output_file, compress), jobs,
+                         cache, changes, counts, headwords=headwords)
+
+SORT_ORDERS = ("pinyin", "simplified", "traditional", "strokes")
+SORT_MEMORY = 64        # MB of entries held by SortingWriter before a spill
+SORT_FANIN = 64         # Runs merged at once
+SORT_OVERHEAD = 600     # Bytes taken by an entry besides its article
+# Combining tone marks, as left by normalize("NFD").
+TONE_DIGITS = {"\u0304": "1", "\u0301": "2", "\u030c": "3", "\u0300": "4"}
+
+def readstrokes(filename):
+    """Read the stroke counts of the characters from a Unihan file.
+
+    The kTotalStrokes lines ("U+4E00<tab>kTotalStrokes<tab>1") of the
+    file (Unihan_IRGSources.txt of Unihan.zip, from unicode.org) are
+    read. When several counts are given, the first one is kept. Returns
+    a dictionary of the stroke count of every character.
+    """
+    strokes = {}
+    with open(filename, "r", encoding="utf8") as unihanfile:
+        for line in unihanfile:
+            fields = line.rstrip("\n").split("\t")
+            if len(fields) == 3 and fields[1] == "kTotalStrokes":
+                strokes[chr(int(fields[0][2:], 16))] = int(
+                    fields[2].split()[0])
+    return strokes
+
+def sortkey(sort_by, strokes=None):
+    """Return the function giving the sort key of an entry.
+
+    The function takes the (simplified, traditional, pinyin) headword
+    of the entry. "sort_by" is one of SORT_ORDERS:
+    pinyin: by toneless pinyin (see tonelesspinyin), then tones.
+    simplified, traditional: by that headword, then toneless pinyin.
+    strokes: by the stroke counts of the characters of the simplified
+        headword, from the "strokes" dictionary (see readstrokes);
+        characters missing from it come after all the others.
+    The entries that are still equal stay in the order of the file.
+    """
+    def tones(pinyin):
+        return "".join([TONE_DIGITS.get(letter, "")
+                        for letter in normalize("NFD", pinyin)])
+    if sort_by == "pinyin":
+        return lambda headword: (tonelesspinyin(headword[2]),
+                                 tones(headword[2]), headword[0],
+                                 headword[1])
+    if sort_by == "simplified":
+        return lambda headword: (headword[0], tonelesspinyin(headword[2]),
+                                 headword[1])
+    if sort_by == "traditional":
+        return lambda headword: (headword[1], tonelesspinyin(headword[2]),
+                                 headword[0])
+    if sort_by == "strokes":
+        return lambda headword: (tuple([strokes.get(character, 999)
+                                        for character in headword[0]]),
+                                 headword[0], tonelesspinyin(headword[2]))
+    raise ValueError("Unknown sort order: %s" % sort_by)
+
+def writerun(records, filename):
+    """Write sorted records to a run file of SortingWriter."""
+    from marshal import dump
+    with open(filename, "wb") as runfile:
+        for record in records:
+            dump(record, runfile)
+    return filename
+
+def readrun(filename):
+    """Yield the records of a run file, deleting it once read."""
+    from marshal import load
+    with open(filename, "rb", buffering=1<<16) as runfile:
+        while True:
+            try:
+                yield load(runfile)
+            except EOFError:
+                break
+    remove(filename)
+
+class SortingWriter(object):
+    """Sort the entries coming from streamentries for another writer.
+
+    The rendered entries are kept until they take about "memory" MB,
+    then sorted and spilled to a run file in a temporary directory.
+    When all the entries are there, the runs (SORT_FANIN at a time, if
+    there are more) and the entries still in memory are merged and
+    handed in order to "writer". "key" gives the sort key of an entry
+    from its headword (see sortkey). The memory used does not depend on
+    the size of the dictionary, only on "memory".
+    """
+
+    def __init__(self, writer, key, memory=SORT_MEMORY):
+        self.writer = writer
+        self.render = writer.render
+        self.key = key
+        self.budget = memory * 2**20
+        self.records = []
+        self.count = 0
+        self.size = 0
+        self.runs = []
+        self.tempdir = None
+
+    def open(self, header, empty=False):
+        """Keep the header for the writer."""
+        self.header = header
+        self.empty = empty
+
+    def write(self, article, headword):
+        """Keep an entry, spilling the entries kept so far if needed."""
+        # The number of the entry keeps the sort stable, and the
+        # records are never compared beyond it.
+        self.records.append((self.key(headword), self.count, article,
+                             headword))
+        self.count += 1
+        self.size += len(article) + SORT_OVERHEAD
+        if self.size > self.budget:
+            self.spill()
+
+    def spill(self):
+        """Sort the entries in memory and write them to a run file."""
+        if self.tempdir is None:
+            from tempfile import mkdtemp
+            self.tempdir = mkdtemp(prefix="cedictxml")
+        self.records.sort()
+        self.runs.append(writerun(self.records, join(self.tempdir,
+                                  "%d.run" % len(self.runs))))
+        self.records = []
+        self.size = 0
+
+    def close(self):
+        """Merge the runs into the writer. Returns what it returns."""
+        from heapq import merge
+        from shutil import rmtree
+        self.records.sort()
+        try:
+            runs = self.runs
+            while len(runs) + 1 > SORT_FANIN:
+                runs = [writerun(merge(*map(readrun, runs[i:i+SORT_FANIN])),
+                                 join(self.tempdir, "%d-%d.run" % (len(runs),
+                                                                   i)))
+                        for i in range(0, len(runs), SORT_FANIN)]
+            self.writer.open(self.header, self.empty)
+            for key, number, article, headword in merge(self.records,
+                                                        *map(readrun, runs)):
+                self.writer.write(article, headword)
+            return self.writer.close()
+        finally:
+            if self.tempdir is not None:
+                rmtree(self.tempdir, ignore_errors=True)
+
+# Words too common to look anything up with in the reverse dictionary.
+STOPWORDS = frozenset(["a", "an", "and", "are", "as", "at", "be", "by", "etc",
+                       "for", "from", "in", "into", "is", "it", "its", "of",
+                       "on", "one's", "oneself", "or", "that", "the", "this",
+                       "to", "what", "which", "who", "with"])
+# Translations that only point to other words: "variant of 詞", "see 詞",
+# "used in 詞", "abbr. for 詞" (followed by the Chinese word, not by English
+# as in "see www.mdbg.net"), and "surname Li"...
+POINTER_RE = compile(r"(?:(?:old |archaic |Japanese )?variant of|"
+                     r"see(?: also)?|used in|abbr\. for) (?=[^\x00-\x7F])|"
+                     r"surname ", I)
+# Text in parentheses: usage notes such as "(coll.)" or "(of a person)".
+PARENTHESES_RE = compile(r"\([^)]*\)")
+WORDTOKEN_RE = compile(r"[a-z]+(?:['-][a-z]+)*")
+
+def translationwords(translation):
+    """Return the words of a translation, as the reverse dictionary uses them.
+
+    The text in parentheses, the pinyin in brackets, the abbreviations
+    (see abbreviations) and STOPWORDS are left out, and the letters are
+    lowered. Every word is returned once. Translations that only point
+    to other words (see POINTER_RE) have no words at all.
+    """
+    if POINTER_RE.match(translation):
+        return []
+    text = PARENTHESES_RE.sub(" ", translation)
+    text = BRACKET_RE.sub(" ", text)
+    text = ABBR_RE.sub(" ", text)
+    words = []
+    for word in WORDTOKEN_RE.findall(text.lower()):
+        if len(word) > 1 and word not in STOPWORDS and word not in words:
+            words.append(word)
+    return words
+
+# A posting of the reverse index is the number of an entry followed by a
+# byte telling which translations of the entry use the word: one bit for
+# each of the first POSTING_SENSES translations, one for all the others
+# and one for the translations that are the word alone.
+POSTING_SENSES = 6
+POSTING_LATER = 1 << POSTING_SENSES
+POSTING_EXACT = 1 << 7
+
+class ReverseIndex(object):
+    """Inverted index of the English words of the translations.
+
+    Every entry added gets a number, and every word of its translations
+    (see translationwords) a posting list: an array of four bytes a
+    posting, with the numbers of the entries using the word (up to 2**24
+    of them) and which of their translations do (see POSTING_SENSES).
+    The entries themselves are kept one after the other as UTF-8 text
+    in a single bytearray, with an array of their offsets, so that
+    memory use stays close to the size of the dictionary file.
+    """
+
+    def __init__(self):
+        self.words = {}
+        self.data = bytearray()
+        self.offsets = array("Q", [0])
+        self.postings = 0
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def add(self, entry):
+        """Index an Entry (see parseentry)."""
+        number = len(self.offsets) - 1
+        senses = {}
+        for sense, translation in enumerate(entry.entry_translation):
+            words = translationwords(translation)
+            bit = 1 << min(sense, POSTING_SENSES)
+            for word in words:
+                senses[word] = senses.get(word, 0) | bit
+            if len(words) == 1:
+                senses[words[0]] |= POSTING_EXACT
+        for word, mask in senses.items():
+            postings = self.words.get(word)
+            if postings is None:
+                self.words[word] = postings = array("I")
+            postings.append(number << 8 | mask)
+        self.postings += len(senses)
+        self.data += ("\t".join((entry.entry_jian, entry.entry_fan,
+                                 entry.entry_pinyin) +
+                                entry.entry_translation)).encode("utf8")
+        self.offsets.append(len(self.data))
+
+    def entry(self, number):
+        """Return the simplified and traditional headwords, the pinyin
+        and the tuple of translations of an entry."""
+        fields = self.data[self.offsets[number]:
+                           self.offsets[number + 1]].decode("utf8").split("\t")
+        return fields[0], fields[1], fields[2], tuple(fields[3:])
+
+def renderreverseentry(word, index, postings):
+    """Convert a word of the reverse dictionary into XDXF text.
+
+    "postings" is the posting list of the word in "index" (see
+    ReverseIndex). Every entry is given with its headwords, its pinyin
+    and the translations using the word, those that are the word alone
+    first. Returns the text (UTF-8 bytes) of the "ar" element, indented
+    as in renderxdxfentry.
+    """
+    ET = lxml()
+    exact = []
+    others = []
+    for posting in postings:
+        jian, fan, pinyin, translations = index.entry(posting >> 8)
+        matching = [translations[sense]
+                    for sense in range(min(len(translations), POSTING_SENSES))
+                    if posting & 1 << sense]
+        if posting & POSTING_LATER:
+            matching.extend([translation for translation
+                             in translations[POSTING_SENSES:]
+                             if word in translationwords(translation)])
+        if jian == fan:
+            text = "%s %s: %s" % (jian, pinyin, "; ".join(matching))
+        else:
+            text = "%s (%s) %s: %s" % (jian, fan, pinyin,
+                                       "; ".join(matching))
+        if posting & POSTING_EXACT:
+            exact.append(text)
+        else:
+            others.append(text)
+    lexicon_ar = ET.Element("ar")
+    ET.SubElement(lexicon_ar, "k").text = word
+    lexicon_ar_def = ET.SubElement(lexicon_ar, "def")
+    for text in exact + others:
+        lexicon_ar_def_def = ET.SubElement(lexicon_ar_def, "def")
+        ET.SubElement(lexicon_ar_def_def, "deftext").text = text
+    xdxf_ar = ET.tostring(lexicon_ar, encoding="utf-8", pretty_print=True)
+    return b"    " + xdxf_ar[:-1].replace(b"\n", b"\n    ") + b"\n"
+
+def reversexdxf(lines, output_file=None, counts=None):
+    """Convert CC-CEDICT lines to an English-Chinese XDXF dictionary.
+
+    The lines are parsed one by one (see iterentries) into a
+    ReverseIndex, in a single pass, then every word of the index is
+    written to the output file, in alphabetical order, as soon as it is
+    rendered (see renderreverseentry). The header of the dictionary is
+    the same as for the Chinese-English one, with lang_from="ENG". By
+    default, the file is named like the Chinese-English one, with
+    "_ENG" added. If "counts" is given, the number of entries read is
+    added to counts["entries"], and the numbers of words and postings
+    of the index are saved in counts["reverse_words"] and
+    counts["reverse_postings"]. Returns the name of the output file.
+    """
+    index = ReverseIndex()
+    header = str()
+    for linenum, entry in progress(iterentries(lines)):
+        if isinstance(entry, str):
+            if not len(index):
+                header = header + entry
+            continue
+        index.add(entry)
+    if output_file is None:
+        parseheader(header)
+        output_file = "CC-CEDICT_" + dictionary_version + "_ENG.xdxf"
+    xdxffile, tail = openxdxf(header, output_file, not index.words, "ENG",
+                              "CHI")
+    for word in sorted(index.words):
+        xdxffile.write(renderreverseentry(word, index, index.words[word]))
+    xdxffile.write(tail)
+    xdxffile.close()
+    if counts is not None:
+        counts["entries"] += len(index)
+        counts["reverse_words"] = len(index.words)
+        counts["reverse_postings"] = index.postings
+    return xdxffile.name
+
+# Layout of the lookup index (see writeindex).
+INDEX_MAGIC = b"CEDXIDX1"
+INDEX_HEADER = Struct("<8sI")
+INDEX_RECORD = Struct("<QIII")
+# Its extension, not StarDict's ".idx": both can be written next to each
+# other without one overwriting the other.
+INDEX_EXTENSION = ".xidx"
+
+def tonelesspinyin(pinyin):
+    """Turn numbered or tone-marked pinyin into a lookup key.
+
+    The tones, spaces and punctuation are dropped, the letters lowered
+    and ü written as v (as with pinyin input methods): "Bei3 jing1",
+    "Běi jīng" and "beijing" all give "beijing", "lu:4" and "lǜ" give
+    "lv".
+    """
+    pinyin = normalize("NFD", pinyin.lower())
+    pinyin = pinyin.replace("u\u0308", "v").replace("u:", "v")
+    return "".join(letter for letter in pinyin if "a" <= letter <= "z")
+
+def indexkeys(jian, fan, pinyin):
+    """Return the keys of an entry in the lookup index.
+
+    The keys are the simplified and the traditional headword and the
+    toneless pinyin (see tonelesspinyin), without repeating the
+    traditional headword when it is the same as the simplified one.
+    """
+    keys = [jian]
+    if fan != jian:
+        keys.append(fan)
+    toneless = tonelesspinyin(pinyin)
+    if toneless:
+        keys.append(toneless)
+    return keys
+
+def writeindex(filename, records):
+    """Write the sorted lookup index of an XDXF file.
+
+    "records" is a list of (key, offset, length) tuples, offset and
+    length being the position in bytes of an "ar" element in the XDXF
+    file. The index is a flat little-endian binary file that can be
+    memory-mapped and binary-searched without reading the dictionary:
+
+        INDEX_HEADER  magic (8 bytes), number of records (uint32)
+        INDEX_RECORD  offset of the "ar" element (uint64), its length,
+                      offset of the key in the keys, length of the key
+                      (uint32 each), for every record, sorted by key
+        keys          the UTF-8 keys, one after the other
+
+    The records are sorted by the UTF-8 bytes of the keys, so that a
+    search only has to compare bytes. Records with the same key (the
+    same pinyin, for instance) follow each other in the order of the
+    XDXF file.
+    """
+    records = sorted((key.encode("utf8"), offset, length)
+                     for key, offset, length in records)
+    indexfile = open(filename, "wb")
+    indexfile.write(INDEX_HEADER.pack(INDEX_MAGIC, len(records)))
+    position = 0
+    for key, offset, length in records:
+        indexfile.write(INDEX_RECORD.pack(offset, length, position, len(key)))
+        position += len(key)
+    for key, offset, length in records:
+        indexfile.write(key)
+    indexfile.close()
+
+def lookupkey(word):
+    """Return the index key (see indexkeys) to look a word up with.
+
+    Words with Chinese characters are looked up as they are, all other
+    words are taken as pinyin, with or without tones (see
+    tonelesspinyin).
+    """
+    if any(character >= "\u2e80" for character in word):
+        return word
+    return tonelesspinyin(word)
+
+class XdxfDictionary(object):
+    """A converted dictionary opened for lookups.
+
+    Both the XDXF file and its index (written with --index, see
+    writeindex) are memory-mapped: opening the dictionary reads nothing
+    but the index header, and every lookup is a binary search of the
+    index that only touches the records and entries it needs.
+
+        with XdxfDictionary("CC-CEDICT.xdxf") as dictionary:
+            dictionary.lookup("北京")     # simplified or traditional
+            dictionary.lookup("Běijīng")  # pinyin, tones are ignored
+            dictionary.prefix("bei", 10)
+
+    The entries are returned as the XDXF text of their "ar" element.
+    """
+
+    def __init__(self, xdxf_file, index_file=None):
+        """Open xdxf_file and its index.
+
+        Without index_file, the index is looked for next to the XDXF
+        file, with the ".xidx" extension (INDEX_EXTENSION).
+        """
+        if index_file is None:
+            index_file = splitext(xdxf_file)[0] + INDEX_EXTENSION
+        self.xdxffile = open(xdxf_file, "rb")
+        self.indexfile = open(index_file, "rb")
+        self.xdxf = mmap(self.xdxffile.fileno(), 0, access=ACCESS_READ)
+        self.index = mmap(self.indexfile.fileno(), 0, access=ACCESS_READ)
+        magic, self.count = INDEX_HEADER.unpack_from(self.index, 0)
+        if magic != INDEX_MAGIC:
+            self.close()
+            raise ValueError("\"%s\" is not a CC-CEDICT XDXF index."
+                             % index_file)
+        if self.xdxf[:6].startswith(COMPRESSED_MAGIC):
+            self.close()
+            raise ValueError("\"%s\" is compressed, the index can only be "
+                             "used with the uncompressed file." % xdxf_file)
+        self.keys = INDEX_HEADER.size + self.count * INDEX_RECORD.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exception):
+        self.close()
+
+    def close(self):
+        self.xdxf.close()
+        self.index.close()
+        self.xdxffile.close()
+        self.indexfile.close()
+
+    def record(self, position):
+        """Return the (key, offset, length) of a record of the index."""
+        offset, length, key_offset, key_length = INDEX_RECORD.unpack_from(
+            self.index, INDEX_HEADER.size + position * INDEX_RECORD.size)
+        key_offset = self.keys + key_offset
+        return self.index[key_offset:key_offset + key_length], offset, length
+
+    def search(self, key):
+        """Position of the first record whose key is not below key."""
+        low, high = 0, self.count
+        while low < high:
+            middle = (low + high) // 2
+            if self.record(middle)[0] < key:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def entries(self, key, prefix=False, limit=None):
+        """Yield the entries whose key is (or starts with) key.
+
+        An entry found through more than one key (a simplified and a
+        traditional headword with the same prefix) is only yielded once.
+        """
+        key = key.encode("utf8")
+        found = set()
+        position = self.search(key)
+        while position < self.count:
+            if limit is not None and len(found) >= limit:
+                break
+            record_key, offset, length = self.record(position)
+            position += 1
+            if record_key != key and not (prefix and
+                                          record_key.startswith(key)):
+                break
+            if offset in found:
+                continue
+            found.add(offset)
+            yield self.xdxf[offset:offset + length].decode("utf8")
+
+    def lookup(self, word):
+        """Return the entries of a word, in hanzi or pinyin."""
+        return list(self.entries(lookupkey(word)))
+
+    def prefix(self, word, limit=None):
+        """Return the entries starting with a word, in hanzi or pinyin.
+
+        At most "limit" entries are returned, in the order of their
+        keys.
+        """
+        key = lookupkey(word)
+        if not key:
+            return []
+        return list(self.entries(key, True, limit))
+
+def peakrss():
+    """Peak resident memory of this process so far, in MB."""
+    try:
+        from resource import getrusage,RUSAGE_SELF
+    except ImportError:
+        # Windows.
+        from ctypes import (windll, Structure, sizeof, byref, c_ulong,
+                            c_size_t)
+        class PROCESS_MEMORY_COUNTERS(Structure):
+            _fields_ = [("cb", c_ulong), ("PageFaultCount", c_ulong),
+                        ("PeakWorkingSetSize", c_size_t),
+                        ("WorkingSetSize", c_size_t),
+                        ("QuotaPeakPagedPoolUsage", c_size_t),
+                        ("QuotaPagedPoolUsage", c_size_t),
+                        ("QuotaPeakNonPagedPoolUsage", c_size_t),
+                        ("QuotaNonPagedPoolUsage", c_size_t),
+                        ("PagefileUsage", c_size_t),
+                        ("PeakPagefileUsage", c_size_t)]
+        counters = PROCESS_MEMORY_COUNTERS()
+        counters.cb = sizeof(counters)
+        windll.psapi.GetProcessMemoryInfo(windll.kernel32.GetCurrentProcess(),
+                                          byref(counters), counters.cb)
+        return counters.PeakWorkingSetSize / 2.0**20
+    if platform == "darwin":
+        # In bytes on macOS, in kilobytes everywhere else.
+        return getrusage(RUSAGE_SELF).ru_maxrss / 2.0**20
+    return getrusage(RUSAGE_SELF).ru_maxrss / 2.0**10
+
+def countlines(lines, metrics):
+    """Pass the lines through, counting them in metrics.
+
+    metrics["lines"] counts all the lines, metrics["header_lines"] the
+    "#" lines of the header.
+    """
+    for line in lines:
+        metrics["lines"] += 1
+        if line.startswith("#"):
+            metrics["header_lines"] += 1
+        yield line
+
+def measure(metrics, name, function, *args, **kwargs):
+    """Run a stage of the conversion and record how long it took.
+
+    The wall time, the CPU time of this process and the peak memory so
+    far are saved in metrics["stages"][name]. Returns whatever the
+    function returns.
+    """
+    wall = perf_counter()
+    cpu = process_time()
+    result = function(*args, **kwargs)
+    metrics["stages"][name] = {"seconds": perf_counter() - wall,
+                               "cpu_seconds": process_time() - cpu,
+                               "peak_rss_mb": peakrss()}
+    return result
+
+def writemetrics(metrics, filename):
+    """Save the metrics of a conversion (see measure) as JSON.
+
+    Lines that are neither header lines nor entries were rejected
+    (see iterentries). The throughput of every stage is given in lines
+    per second.
+    """
+    from json import dump
+    seconds = sum(stage["seconds"] for stage in metrics["stages"].values())
+    for stage in metrics["stages"].values():
+        if stage["seconds"]:
+            stage["lines_per_second"] = metrics["lines"] / stage["seconds"]
+    hits, misses = pyjoin.cache_info()[:2]
+    result = {"version": version,
+              "lines": metrics["lines"],
+              "header_lines": metrics["header_lines"],
+              "entries": metrics["entries"],
+              "rejected_lines": (metrics["lines"] - metrics["header_lines"]
+                                 - metrics["entries"]),
+              "unresolved_refs": metrics["unresolved_refs"],
+              "seconds": seconds,
+              "cpu_seconds": sum(stage["cpu_seconds"]
+                                 for stage in metrics["stages"].values()),
+              "peak_rss_mb": peakrss(),
+              "pinyin_cache": {"hits": hits, "misses": misses},
+              "pinyin_compiled": PINYIN_COMPILED,
+              "stages": metrics["stages"]}
+    if "invalid_articles" in metrics:
+        result["invalid_articles"] = metrics["invalid_articles"]
+    if "reverse_words" in metrics:
+        result["reverse_words"] = metrics["reverse_words"]
+        result["reverse_postings"] = metrics["reverse_postings"]
+    if "pipeline" in metrics:
+        result["pipeline"] = metrics["pipeline"]
+    with open(filename, "w", encoding="utf8") as metricsfile:
+        dump(result, metricsfile, indent=2)
+
+def readmanifest(filename):
+    """Read a manifest: the list of the dictionaries of a batch.
+
+    Every line gives a CC-CEDICT file, optionally followed by the name
+    of its output file (separated by a tab, or by spaces if there is no
+    tab). Blank lines and "#" lines are ignored. Returns a list of
+    (input_file, output_file) tuples, output_file being None when it is
+    not given.
+    """
+    files = []
+    with open(filename, "r", encoding="utf8") as manifest:
+        for line in manifest:
+            line = line.strip()
+            if not line or line.startswith("#"):
+                continue
+            fields = line.split("\t") if "\t" in line else line.split()
+            fields = [field.strip() for field in fields if field.strip()]
+            files.append((fields[0], fields[1] if len(fields) > 1 else None))
+    return files
+
+def batchoutput(input_file, output_dir=None, output_format="xdxf"):
+    """Name of the output file of a dictionary of a batch.
+
+    It is named after the input file (example.u8 becomes example.xdxf,
+    or example.ifo for StarDict), in "output_dir" if given, else next
+    to the input file.
+    """
+    name = splitext(input_file)[0]
+    if output_dir is not None:
+        name = join(output_dir, name.replace("\\", "/").split("/")[-1])
+    return name + (".ifo" if output_format == "stardict" else ".xdxf")
+
+def duplicateoutputs(tasks):
+    """Output files given to more than one task of a batch.
+
+    "tasks" is a list of (input_file, output_file, output_format)
+    tuples (see convertfile). Two dictionaries with the same name in
+    different directories (dir1/a.u8 and dir2/a.u8) are given the same
+    output file by batchoutput when converted to one directory, and
+    would overwrite each other. Returns the sorted list of these files.
+    """
+    seen = set()
+    duplicates = set()
+    for task in tasks:
+        output_file = normcase(abspath(task[1]))
+        if output_file in seen:
+            duplicates.add(task[1])
+        seen.add(output_file)
+    return sorted(duplicates)
+
+def convertfile(task):
+    """Convert one dictionary of a batch (see convertfiles).
+
+    "task" is an (input_file, output_file, output_format) tuple. The
+    dictionary is streamed (see streamentries) with its own headwords;
+    the pinyin cache, syllable tables and regular expressions are those
+    of the process, already warm if it converted other dictionaries
+    before. Returns a report: the input and output files, the numbers
+    of lines, entries, rejected lines and unresolved references, the
+    seconds taken, the pinyin cache hits and misses of this dictionary
+    and the peak memory of the process, or the input file and the
+    error if it could not be converted.
+    """
+    global unresolved_refs
+    input_file, output_file, output_format = task
+    start = perf_counter()
+    hits, misses = pyjoin.cache_info()[:2]
+    counts = {"lines": 0, "header_lines": 0, "entries": 0,
+              "unresolved_refs": 0}
+    unresolved_refs = 0
+    try:
+        with open(input_file, "r", encoding="utf8") as headwordlines:
+            headwords = readheadwords(headwordlines)
+        if output_format == "stardict":
+            writer = StardictWriter(output_file)
+        else:
+            writer = XdxfWriter(output_file)
+        with open(input_file, "r", encoding="utf8") as cedictfile:
+            output_file = streamentries(countlines(cedictfile, counts),
+                                        writer, counts=counts,
+                                        headwords=headwords)
+    except Exception as error:
+        return {"input": input_file, "error": "%s: %s" %
+                (type(error).__name__, error)}
+    finally:
+        HEADWORDS.clear()
+    return {"input": input_file,
+            "output": output_file,
+            "lines": counts["lines"],
+            "entries": counts["entries"],
+            "rejected_lines": (counts["lines"] - counts["header_lines"]
+                               - counts["entries"]),
+            "unresolved_refs": counts["unresolved_refs"],
+            "seconds": perf_counter() - start,
+            "pinyin_cache": {"hits": pyjoin.cache_info()[0] - hits,
+                             "misses": pyjoin.cache_info()[1] - misses},
+            "peak_rss_mb": peakrss()}
+
+def setprogress(function):
+    """Replace progress, the wrapper showing the progress bars."""
+    global progress
+    progress = function
+
+def hideprogress():
+    """Show no progress bars (in the worker processes of convertfiles)."""
+    setprogress(lambda iterable: iterable)
+
+def convertfiles(tasks, jobs=1):
+    """Convert several dictionaries, with "jobs" processes.
+
+    "tasks" is a list of (input_file, output_file, output_format)
+    tuples (see convertfile). The processes convert one dictionary
+    after the other and are only started once, so that the tables and
+    the pinyin cache built for the first dictionaries are shared by
+    the next ones. With a single job, everything is converted in this
+    process. Returns the reports of convertfile, in the order of the
+    tasks. Raises ValueError if two tasks have the same output file
+    (see duplicateoutputs).
+    """
+    if not tasks:
+        return []
+    duplicates = duplicateoutputs(tasks)
+    if duplicates:
+        raise ValueError("Several dictionaries would be converted to %s." %
+                         ", ".join(duplicates))
+    # One progress bar for the whole batch, not one per dictionary.
+    showprogress = progress
+    try:
+        if jobs > 1:
+            from multiprocessing import Pool
+            with Pool(min(jobs, len(tasks)), hideprogress) as pool:
+                reports = list(showprogress(pool.imap(convertfile, tasks,
+                                                      1)))
+        else:
+            hideprogress()
+            reports = [convertfile(task) for task in showprogress(tasks)]
+    finally:
+        setprogress(showprogress)
+    return reports
+
+if __name__=='__main__':
+    # Needed by the worker processes of --jobs in the compiled .exe.
+    from argparse import ArgumentParser
+    from multiprocessing import freeze_support
+    ET = lxml()
+    freeze_support()
     
     # Set and parse arguments.
     argparser = ArgumentParser()
     argparser.add_argument("-i", "--input-file", help="Original CC-CEDICT file to "
-                                                    "be converted.")
+                                                    "be converted. With several "
+                                                    "files, they are all "
+                                                    "converted (see -j).",
+                                                    nargs="+")
     argparser.add_argument("-o", "--output-file", help="Resulting XDXF-format "
-                                                    "file.")
+                                                    "file, or the directory of "
+                                                    "the resulting files when "
+                                                    "converting several "
+                                                    "dictionaries.")
+    argparser.add_argument("-m", "--manifest", help="File listing the "
+                                                    "dictionaries to convert, "
+                                                    "one per line, each "
+                                                    "optionally followed by "
+                                                    "its output file.")
     argparser.add_argument("-d", "--download", help="Download the most recent "
                                                     "release of CC-CEDICT and use "
                                                     "it as input file.",
                                                     action="store_true")
+    argparser.add_argument("--download-dir", help="Where the downloaded "
+                                                    "release of CC-CEDICT is "
+                                                    "kept (default: the current "
+                                                    "directory).", default=".")
+    argparser.add_argument("-s", "--stream", help="Convert the dictionary "
+                                                    "entry by entry, without "
+                                                    "holding it in memory.",
+                                                    action="store_true")
+    argparser.add_argument("-p", "--depinyinize", help="Convert pinyin with "
+                                                    "tone marks (from the input "
+                                                    "file, or the standard input) "
+                                                    "back to numbered pinyin "
+                                                    "(into the output file, or "
+                                                    "the standard output).",
+                                                    action="store_true")
+    argparser.add_argument("-j", "--jobs", help="Number of processes "
+                                                    "converting the dictionary, "
+                                                    "or the dictionaries of a "
+                                                    "batch (default: 1).",
+                                                    type=int, default=1)
+    argparser.add_argument("-c", "--cache", help="Cache of converted entries: "
+                                                    "only the lines that changed "
+                                                    "since the last conversion "
+                                                    "with the same cache are "
+                                                    "converted.")
+    argparser.add_argument("--changelog", help="File listing the headwords "
+                                                    "added, removed and modified "
+                                                    "since the last conversion "
+                                                    "with the same cache.")
+    argparser.add_argument("--metrics", help="JSON file where the time, "
+                                                    "memory and throughput of "
+                                                    "each stage of the "
+                                                    "conversion are saved.")
+    argparser.add_argument("--profile", help="Profile the conversion and "
+                                                    "show the functions taking "
+                                                    "the most time.",
+                                                    action="store_true")
+    argparser.add_argument("--index", help="Also write a sorted binary "
+                                                    "index of the entries, by "
+                                                    "simplified, traditional "
+                                                    "and toneless pinyin, to "
+                                                    "this file (XDXF only, "
+                                                    "usually with the .xidx "
+                                                    "extension).")
+    argparser.add_argument("-f", "--format", help="Output format: xdxf "
+                                                    "(default) or stardict "
+                                                    "(.ifo, .idx, .syn and "
+                                                    ".dict.dz files, named "
+                                                    "after the output file).",
+                                                    choices=["xdxf",
+                                                             "stardict"],
+                                                    default="xdxf")
+    argparser.add_argument("--pipeline", help="Read, parse and convert "
+                                                    "the dictionary in "
+                                                    "pipelined threads, in "
+                                                    "batches of this many "
+                                                    "lines (not with -j or "
+                                                    "-c), and show how busy "
+                                                    "each stage was.",
+                                                    type=int, metavar="BATCH")
+    argparser.add_argument("--queue-depth", help="Number of batches waiting "
+                                                    "between two stages of the "
+                                                    "pipeline (8 by default).",
+                                                    type=int, default=8)
+    argparser.add_argument("--sort-by", help="Sort the entries by toneless "
+                                                    "pinyin, simplified or "
+                                                    "traditional headword, or "
+                                                    "stroke count (with "
+                                                    "--strokes), in runs kept "
+                                                    "on disk.",
+                                                    choices=SORT_ORDERS)
+    argparser.add_argument("--sort-memory", help="MB of entries held in "
+                                                    "memory while sorting, "
+                                                    "before they are written "
+                                                    "to a run file (default: "
+                                                    "%d)." % SORT_MEMORY,
+                                                    type=int,
+                                                    default=SORT_MEMORY)
+    argparser.add_argument("--strokes", help="Unihan file with the "
+                                                    "kTotalStrokes of the "
+                                                    "characters "
+                                                    "(Unihan_IRGSources.txt), "
+                                                    "for --sort-by strokes.")
+    argparser.add_argument("--validate", help="Check every entry against "
+                                                    "xdxf_subset.dtd, a "
+                                                    "hand-written subset of "
+                                                    "the XDXF strict DTD, "
+                                                    "while it is converted, "
+                                                    "and report the "
+                                                    "invalid ones with their "
+                                                    "line (lines taken from a "
+                                                    "cache are not checked "
+                                                    "again).",
+                                                    action="store_true")
+    argparser.add_argument("-r", "--reverse", help="Write an "
+                                                    "English-Chinese "
+                                                    "dictionary instead, "
+                                                    "looked up by the words "
+                                                    "of the translations (XDXF "
+                                                    "only, in a single pass).",
+                                                    action="store_true")
     args = argparser.parse_args()
     
+    if args.depinyinize:
+        if args.input_file:
+            pinyinfile = (line for name in args.input_file
+                          for line in open(name, "r", encoding="utf8"))
+        else:
+            pinyinfile = stdin
+        if args.output_file:
+            resultfile = open(args.output_file, "w", encoding="utf8")
+        else:
+            resultfile = stdout
+        resultfile.writelines(depinyinizelines(pinyinfile))
+        resultfile.close()
+        exit()
+    
     print (declaration)
     
-    if args.input_file and args.download:
+    if (args.input_file or args.manifest) and args.download:
         print ("It's not possible to select an input file and to download the most "
             "recent version.")
         exit()
+    if args.cache and args.jobs > 1:
+        print ("It's not possible to use a cache and several processes.")
+        exit()
+    if args.validate and args.jobs > 1:
+        print ("It's not possible to validate the entries with several "
+               "processes.")
+        exit()
+    if args.pipeline and (args.cache or args.jobs > 1):
+        print ("It's not possible to use a pipeline with a cache or several "
+               "processes.")
+        exit()
+    if args.changelog and not args.cache:
+        print ("A changelog can only be written when using a cache.")
+        exit()
+    if args.reverse and (args.jobs > 1 or args.cache or args.index or
+                         args.pipeline or args.sort_by or args.validate or
+                         args.format != "xdxf"):
+        print ("The reverse dictionary is written as XDXF in a single pass: "
+               "it's not possible to use -j, -c, --index, --pipeline, "
+               "--sort-by, --validate or -f with it.")
+        exit()
+    if args.index and args.output_file and iscompressed(args.output_file):
+        print ("The index can only be written with an uncompressed XDXF "
+               "file.")
+        exit()
+    if args.sort_by == "strokes" and not args.strokes:
+        print ("Sorting by strokes needs the stroke counts of the characters "
+               "(--strokes).")
+        exit()
+    if args.manifest or (args.input_file and len(args.input_file) > 1):
+        if (args.cache or args.index or args.pipeline or args.profile or
+                args.sort_by or args.validate or args.reverse):
+            print ("A cache, an index, a pipeline, a profile, a sort order, "
+                   "validation or a reverse dictionary can only be used with "
+                   "a single dictionary.")
+            exit()
+        files = [(name, None) for name in args.input_file or []]
+        if args.manifest:
+            files = files + readmanifest(args.manifest)
+        if args.output_file:
+            from os import makedirs
+            makedirs(args.output_file, exist_ok=True)
+        tasks = [(input_name, output_name or batchoutput(input_name,
+                  args.output_file, args.format), args.format)
+                 for input_name, output_name in files]
+        if not tasks:
+            print ("The manifest does not list any dictionary.")
+            exit()
+        duplicates = duplicateoutputs(tasks)
+        if duplicates:
+            print ("Several dictionaries would be converted to the same "
+                   "file: %s. Give their output files in the manifest." %
+                   ", ".join("\"%s\"" % name for name in duplicates))
+            exit()
+        print ("Converting %d dictionaries to %s format with %d "
+               "process%s..." % (len(tasks), args.format, args.jobs,
+                                  "es" if args.jobs > 1 else ""))
+        start = perf_counter()
+        reports = convertfiles(tasks, args.jobs)
+        seconds = perf_counter() - start
+        print ("\n%-32s %9s %9s %10s %9s %12s" % ("dictionary", "entries",
+               "rejected", "unresolved", "seconds", "pinyin hits"))
+        for report in reports:
+            if "error" in report:
+                print ("%-32s %s" % (report["input"], report["error"]))
+                continue
+            cache = report["pinyin_cache"]
+            print ("%-32s %9d %9d %10d %9.2f %11.1f%%" % (report["input"],
+                   report["entries"], report["rejected_lines"],
+                   report["unresolved_refs"], report["seconds"],
+                   100.0 * cache["hits"] / ((cache["hits"] + cache["misses"])
+                                            or 1)))
+        converted = [report for report in reports if "error" not in report]
+        print ("\nConverted %d of %d dictionaries in %.2f s (%.2f s one after "
+               "the other)." % (len(converted), len(reports), seconds,
+               sum(report["seconds"] for report in converted)))
+        if args.metrics:
+            from json import dump
+            with open(args.metrics, "w", encoding="utf8") as metricsfile:
+                dump({"version": version, "jobs": args.jobs,
+                      "seconds": seconds, "files": reports}, metricsfile,
+                     indent=2)
+            print ("Metrics saved to \"%s\"." % args.metrics)
+        exit(len(converted) < len(reports))
     if args.input_file:
-        input_file = args.input_file
+        input_file = args.input_file[0]
     elif args.download:
         print ("\nDownloading the most recent release of CC-CEDICT...")
-        input_file = download_cedict()
+        zipname, changed = download_cedict(args.download_dir)
+        if not changed:
+            print ("CC-CEDICT did not change since the last download, using "
+                  "\"%s\"." % zipname)
+        input_file = readzipped(zipname)
     else:
         input_file = "cedict_ts.u8"
+    # Everything from here on is measured by --metrics and --profile.
+    if args.profile:
+        from cProfile import Profile
+        from pstats import Stats
+        profiler = Profile()
+        profiler.enable()
+    metrics = {"lines": 0, "header_lines": 0, "entries": 0,
+               "unresolved_refs": 0, "stages": {}}
+    streamed = (args.stream or args.jobs > 1 or args.cache or args.index or
+                args.format == "stardict" or args.pipeline or args.sort_by or
+                args.validate or args.reverse)
     if args.input_file or not (args.download or args.input_file):
         try:
-            cedictfile = open(input_file, "r", encoding="utf8").read()
-        except:
+            cedictfile = open(input_file, "r", encoding="utf8")
+        except OSError:
             print ("No CC-CEDICT file was found on this "
-                "location (\"%s\").") % input_file
+                "location (\"%s\")." % input_file)
             quit()
+        # A file that cannot be decoded is not a missing file: let the
+        # error through.
+        if not streamed:
+            cedictfile = measure(metrics, "read", cedictfile.read)
     if args.download:
             cedictfile = input_file
+    headwords = None
+    if isinstance(cedictfile, str):
+        cedictfile = cedictfile.split("\n")
+    if streamed and not args.reverse:
+        # The cross-references can only be checked against the headwords
+        # when these are all known before the first entry is converted.
+        if isinstance(cedictfile, list):
+            headwordlines = cedictfile
+        elif args.download:
+            headwordlines = readzipped(zipname)
+        else:
+            headwordlines = open(input_file, "r", encoding="utf8")
+        headwords = measure(metrics, "headwords", readheadwords,
+                            headwordlines)
+    if args.metrics:
+        cedictfile = countlines(cedictfile, metrics)
     
-    # Run conversions.
-    print ("Reading and analysing the dictionary...")
-    converteddict = dictconvert(cedictfile)
-    print ("Converting to XDXF format...")
-    xdxfdic = createxdxf(converteddict)
-    # Save the resulting XDXF file.
-    xdxf_result = ET.tostring(xdxfdic, encoding="utf-8", pretty_print=True,
-                            xml_declaration=True,
-                            doctype=doctypestring).decode("utf-8")
-    xdxf_result = multi_replace(xdxf_result, [("_lb_", "<br />"), ("_lt_", "<"),
-                            ("_mt_", ">")])
-    if args.output_file:
-        output_file = args.output_file
+    if args.reverse:
+        print ("Converting the dictionary to an English-Chinese XDXF "
+               "dictionary...")
+        output_file = measure(metrics, "convert", reversexdxf, cedictfile,
+                              args.output_file, counts=metrics)
+        print ("Reverse index: %d words, %d postings." %
+               (metrics["reverse_words"], metrics["reverse_postings"]))
+    elif streamed:
+        if args.validate:
+            setvalidation()
+        if args.format == "stardict":
+            if args.index:
+                print ("The index is only written with XDXF output.")
+            print ("Converting the dictionary to StarDict format...")
+            writer = StardictWriter(args.output_file)
+        else:
+            print ("Converting the dictionary to XDXF format...")
+            writer = XdxfWriter(args.output_file, args.index)
+        if args.sort_by:
+            print ("Sorting the entries by %s..." % args.sort_by)
+            strokes = readstrokes(args.strokes) if args.strokes else None
+            writer = SortingWriter(writer, sortkey(args.sort_by, strokes),
+                                   args.sort_memory)
+        if args.cache:
+            cache = opencache(args.cache, writer.render)
+            changes = []
+            output_file = measure(metrics, "convert", streamentries,
+                                  cedictfile, writer, cache=cache,
+                                  changes=changes, counts=metrics,
+                                  headwords=headwords)
+            closecache(cache, changes, args.changelog)
+            print ("Cache: %d new or changed entries." % len(changes))
+        elif args.pipeline:
+            pipeline = {"batchsize": args.pipeline,
+                        "depth": args.queue_depth}
+            output_file = measure(metrics, "convert", streamentries,
+                                  cedictfile, writer, counts=metrics,
+                                  pipeline=pipeline, headwords=headwords)
+            metrics["pipeline"] = pipeline
+            print ("\nStage      batches     busy (s)   idle (s)  blocked (s)"
+                   "  queue (max/mean)")
+            for name, stage in pipeline["stages"].items():
+                queue = pipeline["queues"].get(name)
+                print ("%-8s %9d %12.2f %10.2f %12.2f  %s" %
+                       (name, stage["batches"], stage["busy"], stage["idle"],
+                        stage["blocked"], "%d/%.1f" % (queue["max_depth"],
+                        queue["mean_depth"]) if queue else "-"))
+        else:
+            output_file = measure(metrics, "convert", streamentries,
+                                  cedictfile, writer, args.jobs,
+                                  counts=metrics, headwords=headwords)
     else:
-        output_file = "CC-CEDICT_" + dictionary_version + ".xdxf"
-    open(output_file, "w", encoding="utf8").write(xdxf_result)
-    print ("\nSuccess! The CC-CEDICT_ file was converted to \"%s\"." % output_file)
\ No newline at end of file
+        # Run conversions.
+        print ("Reading and analysing the dictionary...")
+        converteddict = measure(metrics, "dictconvert", dictconvert,
+                                cedictfile)
+        metrics["entries"] = len(converteddict) - 1
+        print ("Converting to XDXF format...")
+        xdxfdic = measure(metrics, "createxdxf", createxdxf, converteddict)
+        metrics["unresolved_refs"] = unresolved_refs
+        # Save the resulting XDXF file.
+        xdxf_result = measure(metrics, "serialize", ET.tostring, xdxfdic,
+                              encoding="utf-8", pretty_print=True,
+                              xml_declaration=True, doctype=doctypestring)
+        if args.output_file:
+            output_file = args.output_file
+        else:
+            output_file = "CC-CEDICT_" + dictionary_version + ".xdxf"
+        xdxffile = openoutput(output_file)
+        measure(metrics, "write", xdxffile.write, xdxf_result)
+        measure(metrics, "close", xdxffile.close)
+    print ("\nSuccess! The CC-CEDICT_ file was converted to \"%s\"." % output_file)
+    print ("Pinyin cache: %d hits, %d misses." % pyjoin.cache_info()[:2])
+    print ("Unresolved references: %d." % metrics["unresolved_refs"])
+    if args.validate:
+        metrics["invalid_articles"] = invalid_articles
+        print ("Invalid articles: %d." % invalid_articles)
+    if args.profile:
+        profiler.disable()
+        print ("\nHot functions:")
+        Stats(profiler, stream=stdout).sort_stats("tottime").print_stats(20)
+    if args.metrics:
+        writemetrics(metrics, args.metrics)
+        print ("Metrics saved to \"%s\"." % args.metrics)